@@ -0,0 +1,71 @@
+"""
+Measures startup overhead of the digestive commandline, for --help and for
+running a few digests over a single small file.
+
+Run from the root of the repository: python benchmarks/startup.py
+"""
+from argparse import ArgumentParser
+from os import path
+from statistics import median
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+import time
+
+
+here = path.dirname(path.abspath(__file__))
+root = path.dirname(here)
+
+
+def measure(arguments, repeat):
+    """
+    Measures the wall clock time of running digestive with arguments.
+
+    :param arguments: The commandline arguments to pass to digestive.
+    :param repeat: The number of times to run digestive.
+    :return: The median run time in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'digestive.main', *arguments],  # nosec: B603
+                       cwd=root, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+
+    return median(timings)
+
+
+def main():
+    parser = ArgumentParser(description='measure startup overhead of digestive')
+    parser.add_argument('-n', '--repeat', type=int, default=20,
+                        help='number of runs per scenario (defaults to 20)')
+    arguments = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        small = path.join(directory, 'small')
+        with open(small, 'wb') as file:
+            file.write(bytes(range(256)))
+
+        scenarios = {
+            'python only': None,
+            '--help': ['--help'],
+            'single small file': ['--hashes', '--no-progress', small],
+            'single small file, yaml output': ['--hashes', '--no-progress', '--output', path.join(directory, 'out'),
+                                               small],
+        }
+        for name, arguments_ in scenarios.items():
+            if arguments_ is None:
+                timings = []
+                for _ in range(arguments.repeat):
+                    started = time.perf_counter()
+                    subprocess.run([sys.executable, '-c', 'pass'], check=True)  # nosec: B603
+                    timings.append(time.perf_counter() - started)
+                timing = median(timings)
+            else:
+                timing = measure(arguments_, arguments.repeat)
+
+            print('{:<32} {:>8.1f} ms'.format(name, timing * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+from contextlib import suppress
+import os
+import tarfile
+from threading import Lock
+import weakref
+import zipfile
+import zlib
+
+from digestive.io import Source
+
+
+# signatures archives are required to start with: a zip local file header (or the end of central directory record of
+# an empty zip), gzip, bzip2 or xz compressed data (possibly a compressed tar) and the magic of a ustar (or GNU) header
+_zip_magic = (b'PK\x03\x04', b'PK\x05\x06')
+_compressed_magic = (b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00')
+_tar_magic = b'ustar'
+
+
+def open_archive(fileobj):
+    """
+    Attempts to open a file-like object as a zip or tar archive. Only
+    archives starting at the very start of fileobj are recognized, data that
+    merely contains an archive (like a disk image ending in a zip) or that
+    starts with zeroes (read as an empty tar by tarfile) is not.
+
+    :param fileobj: A seekable, binary file-like object.
+    :return: A zipfile.ZipFile or tarfile.TarFile, or None if fileobj is not a recognized archive.
+    """
+    fileobj.seek(0)
+    header = fileobj.read(512)
+    fileobj.seek(0)
+
+    if header.startswith(_zip_magic) and zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        return zipfile.ZipFile(fileobj)
+
+    if header.startswith(_compressed_magic) or header[257:262] == _tar_magic:
+        fileobj.seek(0)
+        with suppress(tarfile.TarError):
+            # let tarfile detect compression, this requires fileobj to be seekable
+            return tarfile.open(fileobj=fileobj, mode='r:*')
+
+    fileobj.seek(0)
+    return None
+
+
+def members(archive):
+    """
+    Lists the regular file members of an archive.
+
+    :param archive: A zipfile.ZipFile or tarfile.TarFile.
+    :return: A list of zipfile.ZipInfo or tarfile.TarInfo objects.
+    """
+    if isinstance(archive, zipfile.ZipFile):
+        return [info for info in archive.infolist() if not info.is_dir()]
+    else:
+        return [info for info in archive.getmembers() if info.isfile()]
+
+
+def open_member(archive, info):
+    """
+    Opens a member of an archive for streaming reads.
+
+    :param archive: A zipfile.ZipFile or tarfile.TarFile.
+    :param info: The zipfile.ZipInfo or tarfile.TarInfo of the member to
+        open (avoiding a lookup of the member by name).
+    :return: A binary file-like object.
+    """
+    if isinstance(archive, zipfile.ZipFile):
+        return archive.open(info)
+    else:
+        return archive.extractfile(info)
+
+
+def _close(archive, source):
+    archive.close()
+    source.close()
+
+
+class _SharedStream:
+    """
+    File-like object for a member of an archive, serializing access to the
+    file shared by all members of that archive.
+    """
+
+    def __init__(self, fileobj, lock):
+        self._fileobj = fileobj
+        self._lock = lock
+
+    def read(self, size=-1):
+        with self._lock:
+            return self._fileobj.read(size)
+
+    def readinto(self, buffer):
+        with self._lock:
+            return self._fileobj.readinto(buffer)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        with self._lock:
+            return self._fileobj.seek(offset, whence)
+
+    def tell(self):
+        with self._lock:
+            return self._fileobj.tell()
+
+    def seekable(self):
+        return self._fileobj.seekable()
+
+    def close(self):
+        with self._lock:
+            self._fileobj.close()
+
+
+class ArchiveContainer:
+    """
+    A zip or tar archive shared between the sources for its members, opened
+    once rather than for every member.
+
+    The archive is opened when the first of its members is opened and stays
+    open until the members held for processing have been processed (see
+    close_archives), or until none of its members are referenced anymore.
+    Reading members in archive order streams a compressed tar archive in a
+    single pass.
+    """
+
+    def __init__(self, source):
+        """
+        :param source: The source containing the archive (possibly a member
+            of another archive itself).
+        """
+        self.source = source
+        self._archive = None
+        self._finalizer = None
+        # number of members held open for processing, and whether more members might be held still
+        self._held = 0
+        self._complete = False
+        # guards the archive and the file position of source, shared by all members
+        self._lock = Lock()
+
+    def open_member(self, info):
+        """
+        Opens a member of this archive, opening the archive if needed.
+
+        :param info: The zipfile.ZipInfo or tarfile.TarInfo of the member to open.
+        :return: A binary file-like object.
+        """
+        with self._lock:
+            if self._archive is None:
+                self.source.open()
+                self._archive = open_archive(self.source.fd)
+                # close the archive once the container (and with it all its members) is gone
+                self._finalizer = weakref.finalize(self, _close, self._archive, self.source)
+            return _SharedStream(open_member(self._archive, info), self._lock)
+
+    def hold(self):
+        """
+        Keeps the archive open for a member to be processed, until that
+        member is released.
+        """
+        with self._lock:
+            self._held += 1
+
+    def release(self):
+        """
+        Releases a member that has been processed, closing the archive if it
+        was the last member held and no more members will be held.
+        """
+        with self._lock:
+            self._held -= 1
+            done = self._complete and not self._held
+        if done:
+            self.close()
+
+    def complete(self):
+        """
+        Signals that no more members will be held, closing the archive once
+        the members held have been released.
+        """
+        with self._lock:
+            self._complete = True
+            done = not self._held
+        if done:
+            self.close()
+
+    def close(self):
+        """
+        Closes the archive, regardless of its members still being referenced.
+        """
+        with self._lock:
+            if self._finalizer is not None:
+                self._finalizer()
+            self._archive = None
+            self._finalizer = None
+
+
+class ArchiveMemberSource(Source):
+    """
+    Data source reading a single member of a zip or tar archive, without
+    extracting it.
+    """
+
+    def __init__(self, container, info):
+        """
+        :param container: The ArchiveContainer for the archive containing the
+            member.
+        :param info: The zipfile.ZipInfo or tarfile.TarInfo of the member.
+        """
+        if isinstance(info, zipfile.ZipInfo):
+            member, size = info.filename, info.file_size
+        else:
+            member, size = info.name, info.size
+
+        super().__init__('{}!{}'.format(container.source, member))
+        self.container = container
+        self.info = info
+        self.member = member
+        self.size = size
+        # the containers holding their archive open for this member, released when this member is closed
+        self._held = []
+
+    @property
+    def archive(self):
+        """
+        The source containing the archive this is a member of.
+
+        :return: A Source.
+        """
+        return self.container.source
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def device(self):
+        """
+        The ID of the device the archive containing this member resides on.
+
+        :return: A device ID.
+        """
+        return self.archive.device
+
+    @property
+    def modified(self):
+        """
+        The modification time of the archive containing this member.
+
+        :return: The modification time in nanoseconds since the epoch.
+        """
+        return self.archive.modified
+
+    def open(self):
+        self.offset = 0
+        self.fd = self.container.open_member(self.info)
+
+    def hold(self):
+        """
+        Keeps the archive containing this member (and the archives containing
+        that, if nested) open until this member has been processed.
+        """
+        self._held = containers(self)
+        for container in self._held:
+            container.hold()
+
+    def close(self):
+        super().close()
+        held, self._held = self._held, []
+        for container in held:
+            container.release()
+
+
+def containers(source):
+    """
+    Lists the containers of the (nested) archives a source is read from.
+
+    :param source: The source to list containers for.
+    :return: A list of ArchiveContainers, innermost first (empty for sources
+        that are not archive members).
+    """
+    result = []
+    while isinstance(source, ArchiveMemberSource):
+        result.append(source.container)
+        source = source.archive
+    return result
+
+
+def expand_archives(source, depth=1):
+    """
+    Expands a source into sources for its members if it is a zip or tar
+    archive, recursing into nested archives up to depth levels.
+
+    :param source: The source to expand.
+    :param depth: The number of archive levels to expand (0 to not expand
+        source at all).
+    :yield: Either source itself or sources for the members of the
+        archive(s) within it.
+    """
+    if depth < 1:
+        yield source
+        return
+
+    io_mode = source.io_mode
+    if io_mode == 'direct':
+        # archives are read in small, unaligned chunks, which O_DIRECT doesn't allow, read them through the page cache
+        source.io_mode = 'nocache'
+
+    entries = None
+    with source:
+        archive = open_archive(source.fd)
+        if archive is not None:
+            # a truncated or corrupt archive leaves entries None, its members can't be listed reliably
+            with archive, suppress(tarfile.TarError, EOFError, OSError, zlib.error):
+                entries = members(archive)
+
+    if not entries:
+        # not an archive (or an archive without any files that can be listed), source is to be processed as-is
+        source.io_mode = io_mode
+        yield source
+    else:
+        # members share a single container, opening the archive only once to read all of them
+        container = ArchiveContainer(source)
+        for info in entries:
+            yield from expand_archives(ArchiveMemberSource(container, info), depth - 1)
+
+
+def close_archives(sources):
+    """
+    Passes on sources, closing the archives of archive members once the last
+    member passed on has been processed, rather than leaving that to garbage
+    collection. Members of an archive are expected to be passed on
+    consecutively (as expand_archives generates them).
+
+    :param sources: The sources to pass on.
+    :yield: The sources, members held until they're closed after processing.
+    """
+    current = []
+    try:
+        for source in sources:
+            held = containers(source)
+            for container in current:
+                if container not in held:
+                    # no more members of this archive will follow
+                    container.complete()
+            current = held
+
+            if held:
+                source.hold()
+            yield source
+    finally:
+        for container in current:
+            container.complete()
@@ -0,0 +1,228 @@
+import hashlib
+from math import log2
+from struct import Struct
+from tempfile import SpooledTemporaryFile
+from threading import Lock
+
+from digestive.io import Sink, SpooledRecords
+
+
+# random (but fixed) values for each byte value to feed into the gear hash, derived from MD5 for reproducibility
+_gear = [int.from_bytes(hashlib.md5(bytes([value])).digest()[:8], 'big') for value in range(256)]  # nosec: B324
+_mask64 = (1 << 64) - 1
+# chunks are recorded as their offset, length and raw SHA-256 digest
+_record = Struct('>QQ32s')
+
+
+def _mask(bits):
+    # the gear hash shifts left, making the high bits the best mixed
+    return ((1 << bits) - 1) << (64 - bits)
+
+
+class ChunkIndex:
+    """
+    Index of chunks seen across all sources in a run, used to estimate the
+    ratio of data that could be deduplicated.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.seen = set()
+        self.chunks = 0
+        self.size = 0
+        self.unique_size = 0
+
+    def add(self, digest, length):
+        """
+        Adds a chunk to the index.
+
+        :param digest: The (binary) digest of the chunk.
+        :param length: The length of the chunk in bytes.
+        :return: Whether the chunk was not seen before.
+        """
+        with self._lock:
+            self.chunks += 1
+            self.size += length
+            if digest in self.seen:
+                return False
+
+            self.seen.add(digest)
+            self.unique_size += length
+            return True
+
+    def summary(self):
+        """
+        Summarizes the chunks seen.
+
+        :return: A dict of chunk counts, sizes and the deduplication ratio.
+        """
+        with self._lock:
+            return {'chunks': self.chunks,
+                    'unique chunks': len(self.seen),
+                    'bytes': self.size,
+                    'unique bytes': self.unique_size,
+                    'dedup ratio': '{:.4f}'.format(self.size / self.unique_size if self.unique_size else 1.0)}
+
+
+class Chunks(Sink):
+    """
+    Content-defined chunker (FastCDC-style gear hash with normalized
+    chunking), hashing each chunk with SHA-256.
+
+    Chunk boundaries depend only on content, chunks are allowed to span the
+    blocks passed to process.
+    """
+
+    def __init__(self, min_size=2 << 10, avg_size=8 << 10, max_size=64 << 10, name='chunks', **kwargs):
+        """
+        :param min_size: The minimum size of a chunk (except the last).
+        :param avg_size: The desired average size of a chunk.
+        :param max_size: The maximum size of a chunk.
+        :param name: The name of this sink.
+        :param kwargs: Keyword arguments passed on to Sink.
+        """
+        super().__init__(name, **kwargs)
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        # normalized chunking: cut points are harder to hit below the average size, easier beyond it
+        bits = round(log2(avg_size))
+        self._mask_small = _mask(bits + 2)
+        self._mask_large = _mask(max(bits - 2, 1))
+
+        self.offset = 0
+        # chunk records are kept in memory up to 1 MiB, spilling to disk beyond that
+        self._records = SpooledTemporaryFile(max_size=1 << 20)
+        self._chunks = None
+        self._length = 0
+        self._fingerprint = 0
+        self._digest = hashlib.sha256()
+
+    def _find_cut(self, data, start):
+        # local names for speed, this is a loop over every single byte
+        gear, mask64, mask_small, mask_large = _gear, _mask64, self._mask_small, self._mask_large
+        min_size, avg_size, max_size = self.min_size, self.avg_size, self.max_size
+        end = len(data)
+        length = self._length
+        fingerprint = self._fingerprint
+
+        if length < min_size:
+            # no cut points can occur before min_size, skip hashing those bytes
+            skip = min(min_size - length, end - start)
+            start += skip
+            length += skip
+
+        # length includes the byte at position
+        first = length + 1
+        for length, position in enumerate(range(start, end), first):
+            if length > max_size:
+                return position
+
+            fingerprint = ((fingerprint << 1) + gear[data[position]]) & mask64
+            if not fingerprint & (mask_small if length < avg_size else mask_large):
+                return position + 1
+
+        if length >= max_size:
+            return end
+
+        self._fingerprint = fingerprint
+        return None
+
+    def process(self, data):
+        data = memoryview(data)
+        position = 0
+        while position < len(data):
+            cut = self._find_cut(data, position)
+            end = len(data) if cut is None else cut
+            self._digest.update(data[position:end])
+            self._length += end - position
+            position = end
+
+            if cut is not None:
+                self._chunk()
+
+    def _chunk(self):
+        self.add(self.offset, self._length, self._digest.digest())
+        self.offset += self._length
+        self._length = 0
+        self._fingerprint = 0
+        self._digest = hashlib.sha256()
+
+    def add(self, offset, length, digest):
+        """
+        Records a chunk.
+
+        :param offset: The offset of the chunk within the source.
+        :param length: The length of the chunk in bytes.
+        :param digest: The (binary) SHA-256 digest of the chunk.
+        """
+        self._records.write(_record.pack(offset, length, digest))
+
+    def finish(self):
+        # the trailing bytes make up the final chunk
+        if self._length:
+            self._chunk()
+
+    def result(self):
+        if self._chunks is None:
+            self.finish()
+            self._chunks = ChunkRecords(self._records)
+        return self._chunks
+
+
+class ChunkRecords(SpooledRecords):
+    """
+    Chunks of a source, read from the (spooled) temporary file they were
+    written to rather than kept in memory. Iterating yields chunks formatted
+    as offset+length digest, one per chunk.
+    """
+
+    def __init__(self, records):
+        """
+        :param records: The file containing the concatenated chunk records.
+        """
+        super().__init__(records, _record.size)
+
+    def chunks(self):
+        """
+        Reads the chunks, in order.
+
+        :yield: Tuples (offset, length, digest) for each chunk, digest being
+            a hex SHA-256 digest.
+        """
+        for offset, length, digest in map(_record.unpack, self.raw()):
+            yield offset, length, digest.hex()
+
+    def format(self, record):
+        offset, length, digest = _record.unpack(record)
+        return '{}+{} {}'.format(offset, length, digest.hex())
+
+    def __str__(self):
+        # summarize rather than listing a possibly huge number of chunks
+        return '{} chunks'.format(len(self))
+
+
+class ChunkSummary(Chunks):
+    """
+    Content-defined chunker recording chunks in a ChunkIndex shared
+    between sources, rather than listing them for each source.
+    """
+
+    def __init__(self, index=None, **kwargs):
+        """
+        :param index: The ChunkIndex to record chunks in (a private index is
+            used when None).
+        :param kwargs: Keyword arguments passed on to Chunks (chunk sizes).
+        """
+        super().__init__(name='chunk-summary', **kwargs)
+        self.index = index if index is not None else ChunkIndex()
+        self.num_chunks = 0
+        self.new_chunks = 0
+
+    def add(self, offset, length, digest):
+        self.num_chunks += 1
+        self.new_chunks += self.index.add(digest, length)
+
+    def result(self):
+        self.finish()
+        return '{} chunks, {} new'.format(self.num_chunks, self.new_chunks)
@@ -0,0 +1,241 @@
+from datetime import datetime
+import json
+from os import path
+from queue import Queue
+import sqlite3
+from threading import Thread
+
+from digestive.chunking import ChunkRecords
+from digestive.io import SpooledRecords
+
+
+_schema = """
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY,
+        digestive TEXT,
+        started TEXT,
+        info TEXT
+    );
+    CREATE TABLE IF NOT EXISTS sources (
+        id INTEGER PRIMARY KEY,
+        run INTEGER REFERENCES runs (id),
+        source TEXT NOT NULL,
+        size INTEGER,
+        modified INTEGER,
+        completed TEXT
+    );
+    CREATE TABLE IF NOT EXISTS windows (
+        source INTEGER REFERENCES sources (id),
+        name TEXT,
+        number INTEGER,
+        digest TEXT
+    );
+    CREATE TABLE IF NOT EXISTS chunks (
+        source INTEGER REFERENCES sources (id),
+        name TEXT,
+        position INTEGER,
+        length INTEGER,
+        digest TEXT
+    );
+    CREATE TABLE IF NOT EXISTS summaries (
+        id INTEGER PRIMARY KEY,
+        run INTEGER REFERENCES runs (id),
+        summary TEXT
+    );
+    CREATE INDEX IF NOT EXISTS sources_source ON sources (source);
+    CREATE INDEX IF NOT EXISTS sources_size ON sources (size);
+    CREATE INDEX IF NOT EXISTS windows_source ON windows (source, name);
+    CREATE INDEX IF NOT EXISTS windows_digest ON windows (digest);
+    CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source, name);
+    CREATE INDEX IF NOT EXISTS chunks_digest ON chunks (digest);
+"""
+
+
+def _quote(name):
+    # quote identifiers, sink names like sha3-256 are not valid as bare identifiers
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _value(value):
+    # sqlite handles numbers and strings natively, store anything else as text or json
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return json.dumps(value, default=str)
+
+
+def known_sources(database, names=()):
+    """
+    Reads the sources recorded in a database, to be used to skip sources
+    that have been processed before.
+
+    :param database: The file name of the database.
+    :param names: Names of results that should have been recorded for a
+        source (results that are not a column of table sources are looked
+        up as window digests or chunks in tables windows and chunks).
+    :return: A dict mapping source names to a tuple of their last recorded
+        size and modification time, for sources with all of names recorded.
+    """
+    if not path.exists(database):
+        return {}
+
+    connection = sqlite3.connect(database)
+    try:
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(sources)')}
+        conditions = ['{} IS NOT NULL'.format(_quote(name)) if name in columns else
+                      '(EXISTS (SELECT 1 FROM windows WHERE windows.source = sources.id AND windows.name = ?) OR '
+                      'EXISTS (SELECT 1 FROM chunks WHERE chunks.source = sources.id AND chunks.name = ?))'
+                      for name in names]
+        # identifiers are quoted and values are bound as parameters, safe from injection
+        query = 'SELECT source, size, modified FROM sources {} ORDER BY id'.format(  # nosec: B608
+            'WHERE {}'.format(' AND '.join(conditions)) if conditions else '')
+        # sources recorded later take precedence over earlier ones
+        return {source: (size, modified) for source, size, modified in connection.execute(
+            query, [name for name in names if name not in columns for _ in range(2)])}
+    except sqlite3.OperationalError:
+        # database exists, but is missing the sources table
+        return {}
+    finally:
+        connection.close()
+
+
+class ResultStore:
+    """
+    SQLite store for run info and sink results, written by a separate
+    thread in batched transactions.
+
+    Each run is recorded in table runs, each source as a row in table sources
+    with a column for every result name. Window digests are recorded as rows
+    in table windows, one per window, and chunks as rows in table chunks,
+    one per chunk. Documents other than run info and sources are recorded
+    as json in table summaries.
+    """
+
+    def __init__(self, database, indexed=(), batch_size=1000):
+        """
+        :param database: The file name of the database (created if missing).
+        :param indexed: Names of results to index, like hash digests to be
+            looked up (source, size and window digests are always indexed).
+        :param batch_size: The maximum number of documents to write in a
+            single transaction.
+        """
+        self.database = database
+        self.indexed = set(indexed)
+        self.batch_size = batch_size
+        # bounded queue, applying back-pressure when writing can't keep up
+        self._queue = Queue(maxsize=batch_size * 4)
+        self._thread = None
+        self._error = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def open(self):
+        self._error = None
+        self._thread = Thread(target=self._write, name='digestive-database', daemon=True)
+        self._thread.start()
+
+    def add(self, document):
+        """
+        Queues a document to be written to the database.
+
+        :param document: A dict of either run info or a source and its results.
+        :raises RuntimeError: when writing previous documents has failed.
+        """
+        if self._error:
+            raise RuntimeError('failed to write to {}'.format(self.database)) from self._error
+        self._queue.put(document)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Writes any queued documents and stops the writer thread.
+
+        :raises RuntimeError: when writing documents has failed.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if self._error:
+            raise RuntimeError('failed to write to {}'.format(self.database)) from self._error
+
+    def _write(self):
+        connection = None
+        done = False
+        try:
+            # connections can't be shared between threads, connect from the writer thread
+            connection = sqlite3.connect(self.database)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.executescript(_schema)
+            columns = {row[1] for row in connection.execute('PRAGMA table_info(sources)')}
+            for name in self.indexed & columns:
+                # columns added by earlier runs
+                self._index(connection, name)
+            run = None
+
+            while not done:
+                # block for a single document, then take whatever else is available up to batch_size
+                batch = [self._queue.get()]
+                while batch[-1] is not None and len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get())
+                if batch[-1] is None:
+                    batch.pop()
+                    done = True
+
+                with connection:
+                    for document in batch:
+                        if 'source' in document:
+                            self._insert_source(connection, columns, run, document)
+                        elif run is None:
+                            # first document of a run describes the run itself
+                            run = connection.execute('INSERT INTO runs (digestive, started, info) VALUES (?, ?, ?)',
+                                                     (document.get('digestive'), _value(document.get('started')),
+                                                      _value(document))).lastrowid
+                        else:
+                            connection.execute('INSERT INTO summaries (run, summary) VALUES (?, ?)',
+                                               (run, _value(document)))
+        except Exception as e:
+            self._error = e
+            # keep draining the queue to avoid blocking the producer, unless close was requested already
+            while not done:
+                done = self._queue.get() is None
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def _index(self, connection, name):
+        # the name is quoted as an identifier, no values are involved
+        connection.execute('CREATE INDEX IF NOT EXISTS {} ON sources ({})'.format(
+            _quote('sources_{}'.format(name)), _quote(name)))
+
+    def _insert_source(self, connection, columns, run, document):
+        spooled = {name: value for name, value in document.items() if isinstance(value, SpooledRecords)}
+        document = {name: value for name, value in document.items() if name not in spooled}
+
+        for name in document:
+            if name not in columns:
+                # add a column for results not seen before
+                connection.execute('ALTER TABLE sources ADD COLUMN {} TEXT'.format(_quote(name)))
+                if name in self.indexed:
+                    self._index(connection, name)
+                columns.add(name)
+
+        names = ['run'] + list(document)
+        # identifiers are quoted and values are bound as parameters, safe from injection
+        query = 'INSERT INTO sources ({}) VALUES ({})'.format(  # nosec: B608
+            ', '.join(_quote(name) for name in names), ', '.join('?' * len(names)))
+        source = connection.execute(query, [run] + [_value(value) for value in document.values()]).lastrowid
+
+        for name, records in spooled.items():
+            if isinstance(records, ChunkRecords):
+                connection.executemany('INSERT INTO chunks (source, name, position, length, digest) '
+                                       'VALUES (?, ?, ?, ?, ?)',
+                                       ((source, name, *chunk) for chunk in records.chunks()))
+            else:
+                connection.executemany('INSERT INTO windows (source, name, number, digest) VALUES (?, ?, ?, ?)',
+                                       ((source, name, number, digest) for number, digest in enumerate(records)))
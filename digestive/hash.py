@@ -1,6 +1,7 @@
 import hashlib
+from tempfile import SpooledTemporaryFile
 
-from digestive.io import Sink
+from digestive.io import Sink, SpooledRecords
 
 
 class HashDigest(Sink):
@@ -11,6 +12,14 @@ class HashDigest(Sink):
     def process(self, data):
         self._digest.update(data)
 
+    def copy(self):
+        """
+        Copies the digest of this sink in its current state.
+
+        :return: A hashlib digest object, independent of this sink.
+        """
+        return self._digest.copy()
+
     def result(self):
         return self._digest.hexdigest()
 
@@ -43,3 +52,75 @@ class SHA3256(HashDigest):
 class SHA3512(HashDigest):
     def __init__(self, **kwargs):
         super().__init__('sha3-512', hashlib.sha3_512(), **kwargs)
+
+
+class HashWindows(Sink):
+    """
+    Wrapper for a HashDigest sink, additionally calculating the same digest
+    for every consecutive window of window_size bytes.
+    """
+
+    def __init__(self, sink, window_size, **kwargs):
+        super().__init__(sink.name, **kwargs)
+        self.sink = sink
+        self.window_size = window_size
+        # copy the wrapped digest before it receives any data to get a fresh one for each window
+        self._initial = sink.copy()
+        self._window = self._initial.copy()
+        self._remaining = window_size
+        # raw window digests are kept in memory up to 1 MiB, spilling to disk beyond that
+        self._digests = SpooledTemporaryFile(max_size=1 << 20)
+        self._windows = None
+
+    def process(self, data):
+        self.sink.process(data)
+
+        data = memoryview(data)
+        while len(data):
+            # split data on window boundaries
+            chunk, data = data[:self._remaining], data[self._remaining:]
+            self._window.update(chunk)
+            self._remaining -= len(chunk)
+            if not self._remaining:
+                self._next_window()
+
+    def _next_window(self):
+        self._digests.write(self._window.digest())
+        self._window = self._initial.copy()
+        self._remaining = self.window_size
+
+    def result(self):
+        return self.sink.result()
+
+    def results(self):
+        yield self.name, self.result()
+
+        if self._windows is None:
+            if self._remaining < self.window_size:
+                # include the trailing partial window
+                self._next_window()
+            self._windows = WindowDigests(self._digests, self._initial.digest_size, self.window_size)
+
+        yield '{}-windows'.format(self.name), self._windows
+
+
+class WindowDigests(SpooledRecords):
+    """
+    Digests of consecutive windows of a source, read from the (spooled)
+    temporary file they were written to rather than kept in memory.
+    Iterating yields hex digests, one per window.
+    """
+
+    def __init__(self, digests, digest_size, window_size):
+        """
+        :param digests: The file containing the concatenated raw digests.
+        :param digest_size: The size of a single raw digest.
+        :param window_size: The size of the windows digested.
+        """
+        super().__init__(digests, digest_size)
+        self.digest_size = digest_size
+        self.window_size = window_size
+
+    def __str__(self):
+        # summarize rather than listing a possibly huge number of digests
+        return '{} windows of {} bytes'.format(len(self), self.window_size)
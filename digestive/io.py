@@ -1,5 +1,32 @@
 from abc import abstractmethod
+from contextlib import suppress
+import mmap
+import os
 from os import path
+import sys
+from threading import Condition, Lock
+
+
+# I/O modes supported by Source, trading throughput for page cache pollution
+io_modes = ('default', 'sequential', 'nocache', 'direct')
+
+
+def page_align(size):
+    """
+    Rounds a size up to whole pages, as required for buffers used with O_DIRECT.
+
+    :param size: The size to round up.
+    :return: The smallest multiple of the page size of at least size bytes.
+    """
+    return -(-size // mmap.PAGESIZE) * mmap.PAGESIZE
+
+
+def _advise(fd, offset, length, advice):
+    # posix_fadvise is a hint, ignore platforms or files that don't support it
+    # (advice is passed by name, as the constants are missing on platforms without posix_fadvise)
+    if hasattr(os, 'posix_fadvise'):
+        with suppress(OSError):
+            os.posix_fadvise(fd, offset, length, getattr(os, advice))
 
 
 class Source:
@@ -7,9 +34,24 @@ class Source:
     Data source context manager and reader.
     """
 
-    def __init__(self, source):
+    # whether this source is a stream of unknown size that can only be read once
+    streaming = False
+
+    def __init__(self, source, io_mode='default'):
+        """
+        :param source: The name of the file to read from.
+        :param io_mode: One of io_modes: 'default' to not do anything
+            special, 'sequential' to advise the kernel to read ahead,
+            'nocache' to also drop data that has been read from the page
+            cache, or 'direct' to bypass the page cache altogether using
+            O_DIRECT (falling back to 'nocache' where that is unsupported).
+        """
         self.source = source
+        self.io_mode = io_mode
         self.fd = None
+        self.offset = 0
+        self._direct = False
+        self._modified = None
 
     def __str__(self):
         return self.source
@@ -17,13 +59,52 @@ class Source:
     def __len__(self):
         return path.getsize(self.source)
 
+    @property
+    def device(self):
+        """
+        The ID of the device this source resides on.
+
+        :return: A device ID.
+        """
+        return os.stat(self.source).st_dev
+
+    @property
+    def modified(self):
+        """
+        The modification time of this source, as recorded when it was last
+        opened (or when first requested if it wasn't opened yet).
+
+        :return: The modification time in nanoseconds since the epoch.
+        """
+        if self._modified is None:
+            self._modified = os.stat(self.source).st_mtime_ns
+        return self._modified
+
     def __enter__(self):
         self.open()
         return self
 
     def open(self):
-        # open named source in binary mode for reading
-        self.fd = open(self.source, 'rb')  # noqa: SIM115 (cannot use context handler here)
+        self.offset = 0
+        self._direct = False
+        self.fd = None
+        if self.io_mode == 'direct' and hasattr(os, 'O_DIRECT'):
+            try:
+                # O_DIRECT requires unbuffered reads into aligned buffers, see allocate
+                self.fd = open(os.open(self.source, os.O_RDONLY | os.O_DIRECT), 'rb', buffering=0)  # noqa: SIM115
+                self._direct = True
+            except OSError:
+                # file system might not support O_DIRECT, fall back to regular open
+                pass
+
+        if self.fd is None:
+            # open named source in binary mode for reading
+            self.fd = open(self.source, 'rb')  # noqa: SIM115 (cannot use context handler here)
+            if self.io_mode != 'default':
+                _advise(self.fd.fileno(), 0, 0, 'POSIX_FADV_SEQUENTIAL')
+
+        # record the modification time before reading, a source modified while being read shows up as modified later
+        self._modified = os.fstat(self.fd.fileno()).st_mtime_ns
 
     def readinto(self, buffer):
         """
@@ -32,23 +113,79 @@ class Source:
         :param buffer: The buffer to read into.
         :return: The number of bytes read.
         """
-        return self.fd.readinto(buffer)
+        num_read = self.fd.readinto(buffer)
+        if num_read and self.io_mode != 'default' and not self._direct:
+            if self.io_mode != 'sequential':
+                # data has been copied into buffer, drop it from the page cache
+                _advise(self.fd.fileno(), self.offset, num_read, 'POSIX_FADV_DONTNEED')
+            # request the kernel to start reading the next block
+            _advise(self.fd.fileno(), self.offset + num_read, len(buffer), 'POSIX_FADV_WILLNEED')
+
+        self.offset += num_read or 0
+        return num_read
+
+    def read(self):
+        """
+        Read all remaining data from this source at once.
+
+        :return: The data read, as bytes.
+        """
+        data = self.fd.read()
+        self.offset += len(data)
+        return data
+
+    def buffer_size(self, block_size):
+        """
+        Determines the size of buffers suitable to read blocks from this source into.
 
-    def blocks(self, block_size=1 << 20):
+        :param block_size: The requested size of the buffer.
+        :return: A buffer size of at least block_size bytes.
+        """
+        if self._direct:
+            # round size up to whole pages to satisfy O_DIRECT
+            return page_align(block_size)
+        else:
+            return block_size
+
+    def allocate(self, block_size):
+        """
+        Allocates a buffer suitable to read blocks from this source into.
+
+        :param block_size: The requested size of the buffer.
+        :return: A writable memoryview of at least block_size bytes.
+        """
+        if self._direct:
+            # anonymous maps are page-aligned, as required by O_DIRECT
+            return memoryview(mmap.mmap(-1, self.buffer_size(block_size)))
+        else:
+            return memoryview(bytearray(block_size))
+
+    def blocks(self, block_size=1 << 20, pool=None):
         """
         Generator for blocks of at most block_size read from this source.
 
         :param block_size: Maximum number of bytes to read at a time.
+        :param pool: The BufferPool to draw buffers from (buffers are
+            allocated for this generator alone if None).
         :yield: Blocks of data
         """
-        current, swap = memoryview(bytearray(block_size)), memoryview(bytearray(block_size))
-        num_read = self.readinto(current)
-        while num_read:
-            # yield the current block, excluding possible stale bytes not read
-            yield current[:num_read]
-            # swap buffers, allowing next block to be read into different buffer
-            current, swap = swap, current
+        if pool is None:
+            current, swap = self.allocate(block_size), self.allocate(block_size)
+        else:
+            # acquire both buffers at once, avoiding holding one while waiting for the other
+            current, swap = pool.acquire(self.buffer_size(block_size), count=2)
+
+        try:
             num_read = self.readinto(current)
+            while num_read:
+                # yield the current block, excluding possible stale bytes not read
+                yield current[:num_read]
+                # swap buffers, allowing next block to be read into different buffer
+                current, swap = swap, current
+                num_read = self.readinto(current)
+        finally:
+            if pool is not None:
+                pool.release(current, swap)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
@@ -58,6 +195,196 @@ class Source:
         self.fd = None
 
 
+class BufferPool:
+    """
+    Pool of buffers shared between sources, limiting the total amount of
+    memory allocated for buffers.
+
+    Buffers are page-aligned (making them suitable for O_DIRECT) and are
+    reused once released. Acquiring buffers blocks while the memory budget
+    is exhausted, until enough buffers have been released.
+    """
+
+    def __init__(self, max_memory=None):
+        """
+        :param max_memory: The maximum number of bytes to allocate for
+            buffers in total (or None for no limit).
+        """
+        self.max_memory = max_memory
+        self.allocated = 0
+        self.peak = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self._free = {}
+        self._condition = Condition()
+
+    def acquire(self, size, count=1):
+        """
+        Acquires buffers from the pool, waiting for buffers to be released if
+        the budget does not allow allocating new ones.
+
+        :param size: The size of the buffers.
+        :param count: The number of buffers to acquire.
+        :return: A list of count writable memoryviews of size bytes.
+        :raises ValueError: when the buffers requested exceed the budget.
+        """
+        if self.max_memory is not None and size * count > self.max_memory:
+            raise ValueError('cannot acquire {} buffers of {} bytes within {} bytes'.format(
+                count, size, self.max_memory))
+
+        with self._condition:
+            while True:
+                free = self._free.setdefault(size, [])
+                reused = min(len(free), count)
+                needed = (count - reused) * size
+                if self.max_memory is None or self.allocated + needed <= self.max_memory:
+                    break
+                if not self._evict(size, needed):
+                    # apply back-pressure until other sources release their buffers
+                    self.waits += 1
+                    self._condition.wait()
+
+            buffers = [free.pop() for _ in range(reused)]
+            self.hits += reused
+            self.misses += count - reused
+            self.allocated += needed
+            self.peak = max(self.peak, self.allocated)
+
+        # allocate outside of the lock, anonymous maps are page-aligned
+        return buffers + [memoryview(mmap.mmap(-1, size)) for _ in range(count - reused)]
+
+    def _evict(self, size, needed):
+        # drop unused buffers of other sizes to make room for needed bytes
+        for other, free in self._free.items():
+            while other != size and free and self.allocated + needed > self.max_memory:
+                free.pop()
+                self.allocated -= other
+
+        return self.allocated + needed <= self.max_memory
+
+    def release(self, *buffers):
+        """
+        Returns buffers to the pool.
+
+        :param buffers: The buffers to return, as acquired from this pool.
+        """
+        with self._condition:
+            for buffer in buffers:
+                self._free.setdefault(len(buffer), []).append(buffer)
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        Summarizes the use of this pool.
+
+        :return: A dict of statistics.
+        """
+        with self._condition:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'waits': self.waits,
+                    'allocated': self.allocated,
+                    'peak': self.peak}
+
+
+class StdinSource(Source):
+    """
+    Data source reading from standard input, allowing digestive to be used
+    within a pipeline.
+    """
+
+    streaming = True
+
+    def __init__(self, expected_size=None):
+        """
+        :param expected_size: The number of bytes expected to be read (or
+            None if unknown).
+        """
+        super().__init__('-')
+        self.expected_size = expected_size
+
+    def __str__(self):
+        return '<stdin>'
+
+    def __len__(self):
+        # len() requires an int, 0 signals unknown size
+        return self.expected_size or 0
+
+    @property
+    def device(self):
+        return None
+
+    @property
+    def modified(self):
+        return None
+
+    def open(self):
+        self.offset = 0
+        self.fd = sys.stdin.buffer
+
+    def close(self):
+        # leave closing stdin to the interpreter
+        self.fd = None
+
+
+class SpooledRecords:
+    """
+    Fixed-size binary records read from the (spooled) temporary file they
+    were written to rather than kept in memory, for results that grow with
+    the size of a source. Iterating yields the records one at a time,
+    allowing output to be written without holding all of them in memory.
+    """
+
+    def __init__(self, records, record_size):
+        """
+        :param records: The file containing the concatenated records.
+        :param record_size: The size of a single record.
+        """
+        self.record_size = record_size
+        self._records = records
+        # iterations (possibly by different output collectors) each track their own offset into the shared file
+        self._lock = Lock()
+
+    def __len__(self):
+        with self._lock:
+            return self._records.seek(0, 2) // self.record_size
+
+    def raw(self):
+        """
+        Reads the records, in order.
+
+        :yield: Records as bytes, one at a time.
+        """
+        offset = 0
+        while True:
+            with self._lock:
+                self._records.seek(offset)
+                chunk = self._records.read(self.record_size << 10)
+            if not chunk:
+                return
+            offset += len(chunk)
+            for start in range(0, len(chunk), self.record_size):
+                yield chunk[start:start + self.record_size]
+
+    def format(self, record):
+        """
+        Formats a single record for output.
+
+        :param record: The record to format.
+        :return: The record as a string (hex by default).
+        """
+        return record.hex()
+
+    def __iter__(self):
+        """
+        Iterates the records, in order.
+
+        :yield: Records formatted as strings (see format).
+        """
+        yield from map(self.format, self.raw())
+
+
 class Sink:
     """
     Base class for digesting data in chunks.
@@ -83,3 +410,38 @@ class Sink:
         :return: The result of this sink as a string.
         """
         pass
+
+    def results(self):
+        """
+        Creates the named results of this sink, allowing a sink to produce
+        more than a single result.
+
+        :yield: Tuples of (name, result), defaults to a single result named
+            after this sink.
+        """
+        yield self.name, self.result()
+
+
+class Tee(Sink):
+    """
+    Sink writing all data it processes to a binary stream, copying data
+    while it is being digested.
+    """
+
+    def __init__(self, stream, **kwargs):
+        """
+        :param stream: The binary stream to write to.
+        :param kwargs: Keyword arguments passed on to Sink.
+        """
+        super().__init__('tee', **kwargs)
+        self.stream = stream
+
+    def process(self, data):
+        self.stream.write(data)
+
+    def result(self):
+        return None
+
+    def results(self):
+        # copying data produces no results
+        yield from ()
@@ -1,18 +1,26 @@
 from argparse import ArgumentParser
-from concurrent.futures import ThreadPoolExecutor, wait
+from collections import deque
+from contextlib import ExitStack, redirect_stdout
 from datetime import datetime, timezone
+from functools import partial
+import heapq
+from importlib import import_module
 from math import log
 from os import path, walk
 import re
 import sys
 import time
-
-import yaml
+import zlib
 
 import digestive
-from digestive.entropy import Entropy
-from digestive.hash import MD5, SHA1, SHA256, SHA3256, SHA3512, SHA512
-from digestive.io import Source
+from digestive.io import BufferPool, io_modes, page_align, Source, SpooledRecords, StdinSource
+
+
+# NB: modules that are expensive to import (yaml, concurrent.futures, hashlib, zipfile, tarfile) are imported where
+#     they are needed, keeping startup fast for --help and runs over a single small file
+
+# maximum number of small sources (smaller than a single block) to process as a single job
+_batch_size = 64
 
 
 # binary suffixes for byte sizes
@@ -55,6 +63,72 @@ def num_bytes(size):
         raise TypeError(size)
 
 
+def shard_spec(spec):
+    """
+    Converts a shard specification K/N into a tuple of ints.
+
+    :param spec: The specification to be parsed, K being a 1-based index
+        into N shards.
+    :return: A tuple (K, N).
+    :raises TypeError: on unrecognized input.
+    """
+    match = re.match(r'(?P<index>\d+)/(?P<count>\d+)$', spec)
+    if match:
+        index, count = (int(value) for value in match.groups())
+        if 1 <= index <= count:
+            return index, count
+
+    raise TypeError(spec)
+
+
+def chunk_sizes(sizes):
+    """
+    Converts a specification of chunk sizes MIN:AVG:MAX into a tuple of ints.
+
+    :param sizes: The sizes to be parsed, each a byte size as accepted by num_bytes.
+    :return: A tuple (min, avg, max).
+    :raises TypeError: on unrecognized input.
+    """
+    sizes = tuple(num_bytes(size) for size in sizes.split(':'))
+    if len(sizes) != 3 or not 0 < sizes[0] <= sizes[1] <= sizes[2]:
+        raise TypeError(sizes)
+
+    return sizes
+
+
+def device_jobs(spec):
+    """
+    Converts a specification of concurrent readers for a device DEVICE=JOBS
+    into a tuple.
+
+    :param spec: The specification to be parsed, DEVICE being either a
+        device node or any path on the device.
+    :return: A tuple (device ID, jobs).
+    :raises TypeError: on unrecognized input or an inaccessible DEVICE.
+    """
+    from digestive.schedule import device_of
+
+    name, _, jobs = spec.rpartition('=')
+    if not name or not jobs.isdigit() or not int(jobs):
+        raise TypeError(spec)
+
+    try:
+        return device_of(name), int(jobs)
+    except OSError as e:
+        raise TypeError(spec) from e
+
+
+def sink_type(name):
+    """
+    Resolves a sink type by its qualified name, importing its module on first use.
+
+    :param name: The qualified name of the sink type, formatted as module:type.
+    :return: The sink type.
+    """
+    module, _, name = name.partition(':')
+    return getattr(import_module(module), name)
+
+
 def parse_arguments(arguments=None):
     """
     Parses commandline arguments defining both program options and input and output.
@@ -64,42 +138,103 @@ def parse_arguments(arguments=None):
     """
     parser = ArgumentParser(description='run multiple digests on files')
     # hash digest sinks
-    parser.add_argument('-m', '--md5', action='append_const', dest='sinks', const=MD5,
+    parser.add_argument('-m', '--md5', action='append_const', dest='sinks', const='digestive.hash:MD5',
                         help='calculate MD5 hash')
-    parser.add_argument('-1', '--sha1', action='append_const', dest='sinks', const=SHA1,
+    parser.add_argument('-1', '--sha1', action='append_const', dest='sinks', const='digestive.hash:SHA1',
                         help='calculate SHA-1 hash')
-    parser.add_argument('-2', '--sha256', action='append_const', dest='sinks', const=SHA256,
+    parser.add_argument('-2', '--sha256', action='append_const', dest='sinks', const='digestive.hash:SHA256',
                         help='calculate SHA-256 hash')
-    parser.add_argument('-5', '--sha512', action='append_const', dest='sinks', const=SHA512,
+    parser.add_argument('-5', '--sha512', action='append_const', dest='sinks', const='digestive.hash:SHA512',
                         help='calculate SHA-512 hash')
-    parser.add_argument('-3', '--sha3-256', action='append_const', dest='sinks', const=SHA3256,
+    parser.add_argument('-3', '--sha3-256', action='append_const', dest='sinks', const='digestive.hash:SHA3256',
                         help='calculate SHA3-256 hash')
-    parser.add_argument('--sha3-512', action='append_const', dest='sinks', const=SHA3512,
+    parser.add_argument('--sha3-512', action='append_const', dest='sinks', const='digestive.hash:SHA3512',
                         help='calculate SHA3-512 hash')
 
-    hashes = [MD5, SHA1, SHA256, SHA512, SHA3256]
+    hashes = ['digestive.hash:MD5', 'digestive.hash:SHA1', 'digestive.hash:SHA256', 'digestive.hash:SHA512',
+              'digestive.hash:SHA3256']
     # convenience switch to include all hashes
     parser.add_argument('--hashes', action='store_const', dest='sinks', const=hashes,
                         help='calculate MD5, SHA-1, SHA-256, SHA-512 and SHA3-256 hashes (equivalent to -m1253)')
     # entropy sink
-    parser.add_argument('-e', '--entropy', action='append_const', dest='sinks', const=Entropy,
+    parser.add_argument('-e', '--entropy', action='append_const', dest='sinks', const='digestive.entropy:Entropy',
                         help='calculate binary entropy')
+    # byte statistics sinks, sharing a single pass over the data with entropy
+    parser.add_argument('--chi-square', action='append_const', dest='sinks', const='digestive.stats:ChiSquare',
+                        help='calculate chi-square of the distribution of byte values')
+    parser.add_argument('--mean', action='append_const', dest='sinks', const='digestive.stats:Mean',
+                        help='calculate arithmetic mean of byte values')
+    parser.add_argument('--monte-carlo-pi', action='append_const', dest='sinks', const='digestive.stats:MonteCarloPi',
+                        help='calculate Monte Carlo value for pi (adds about half the time entropy takes)')
+    parser.add_argument('--serial-correlation', action='append_const', dest='sinks',
+                        const='digestive.stats:SerialCorrelation',
+                        help='calculate serial correlation coefficient of consecutive bytes (adds about the time '
+                             'entropy takes)')
+
+    statistics = ['digestive.entropy:Entropy', 'digestive.stats:ChiSquare', 'digestive.stats:Mean',
+                  'digestive.stats:MonteCarloPi', 'digestive.stats:SerialCorrelation']
+    # convenience switch to include all statistics
+    parser.add_argument('--statistics', action='store_const', dest='sinks', const=statistics,
+                        help='calculate entropy, chi-square, mean, Monte Carlo pi and serial correlation (taking '
+                             'about 2.5 times as long as entropy alone)')
+    # content-defined chunking sinks
+    parser.add_argument('--chunks', action='append_const', dest='sinks', const='digestive.chunking:Chunks',
+                        help='list content-defined chunks and their SHA-256 hashes')
+    parser.add_argument('--chunk-summary', action='append_const', dest='sinks', const='digestive.chunking:ChunkSummary',
+                        help='summarize unique content-defined chunks across all sources')
+    parser.add_argument('--chunk-sizes', type=chunk_sizes, metavar='MIN:AVG:MAX', default='2k:8k:64k',
+                        help='minimum, average and maximum size of chunks (defaults to 2k:8k:64k)')
+    parser.add_argument('-w', '--hash-window', type=num_bytes, metavar='BYTES',
+                        help='additionally calculate hashes for every consecutive window of %(metavar)s')
     # misc options
     parser.add_argument('-j', '--jobs', type=int, metavar='JOBS',
-                        help='use up to %(metavar)s threads to process digests (defaults to the number of digests)')
+                        help='use up to %(metavar)s threads to process digests for each source being read '
+                             '(defaults to the number of digests)')
     parser.add_argument('-b', '--block-size', type=num_bytes, metavar='BYTES', default='1M',
                         help='read data in chunks of %(metavar)s at a time (defaults to 1M)')
+    parser.add_argument('--io-mode', choices=io_modes, default='default',
+                        help='hint the kernel to read ahead (sequential), to also drop data that was read from the '
+                             'page cache (nocache) or bypass the page cache altogether (direct) (defaults to default)')
+    parser.add_argument('--max-memory', type=num_bytes, metavar='BYTES',
+                        help='limit memory used for block buffers to %(metavar)s, sources wait for buffers to become '
+                             'available when exhausted (at least twice the block size)')
     parser.add_argument('-p', '--progress', choices=('bytes', 'speed'), default='bytes',
                         help='show progress information (defaults to bytes)')
     parser.add_argument('-P', '--no-progress', action='store_false', dest='progress',
                         help='disable progress output (always disabled for redirected output)')
     parser.add_argument('-r', '--recursive', action='store_true',
                         help='process sources recursively')
+    parser.add_argument('-a', '--archives', action='store_const', dest='archive_depth', const=1, default=0,
+                        help='process the members of zip and tar archives rather than the archives themselves')
+    parser.add_argument('--archive-depth', type=int, metavar='DEPTH',
+                        help='process members of archives nested up to %(metavar)s levels deep (implies -a)')
+    parser.add_argument('-d', '--devices', action='store_true',
+                        help='process sources on different devices in parallel, limiting concurrent reads per device')
+    parser.add_argument('--device-jobs', type=device_jobs, action='append', metavar='DEVICE=JOBS',
+                        help='read up to JOBS sources at a time from DEVICE (a device node or any path on it, '
+                             'implies -d)')
+    parser.add_argument('--ssd-jobs', type=int, metavar='JOBS', default=4,
+                        help='read up to %(metavar)s sources at a time from non-rotational devices, rotational or '
+                             'unknown devices are read one source at a time (defaults to 4)')
+    parser.add_argument('--shard', type=shard_spec, metavar='K/N',
+                        help='only process the K-th of N deterministic partitions of the sources')
+    parser.add_argument('--shard-by', choices=('path', 'size'), default='path',
+                        help='partition sources by a hash of their path or into shards of balanced total size '
+                             '(defaults to path)')
     parser.add_argument('-o', '--output',
                         help='write yaml-encoded output to file')
+    parser.add_argument('--output-db', metavar='PATH',
+                        help='write output to SQLite database %(metavar)s, indexed by source, size and digest')
+    parser.add_argument('--incremental', action='store_true',
+                        help='skip sources recorded in --output-db with the same size and modification time and '
+                             'all requested results in an earlier run')
+    parser.add_argument('--tee', metavar='PATH',
+                        help='copy all data read to %(metavar)s (- for stdout, moving console output to stderr)')
+    parser.add_argument('--expected-size', type=num_bytes, metavar='BYTES',
+                        help='expect to read %(metavar)s from stdin, used to show progress')
     # positional arguments: sources
     parser.add_argument('sources', metavar='FILE', nargs='+',
-                        help='input files')
+                        help='input files (- to read from stdin)')
 
     arguments = parser.parse_args(arguments)
     process_arguments(arguments, parser)
@@ -117,8 +252,25 @@ def process_arguments(arguments, parser):
     if not arguments.sinks:
         parser.error('at least one sink is required')
 
+    # sinks are passed as qualified names, avoiding imports until they're actually used
+    arguments.sinks = [sink_type(sink) if isinstance(sink, str) else sink for sink in arguments.sinks]
     arguments.jobs = arguments.jobs if arguments.jobs else len(arguments.sinks)
 
+    # O_DIRECT reads into buffers of whole pages, which might be larger than block_size
+    buffer_size = page_align(arguments.block_size) if arguments.io_mode == 'direct' else arguments.block_size
+    if arguments.max_memory is not None and arguments.max_memory < 2 * buffer_size:
+        parser.error('--max-memory should allow for at least two blocks of --block-size{}'.format(
+            ' (rounded up to whole pages for --io-mode direct)' if buffer_size != arguments.block_size else ''))
+
+    if arguments.tee and (arguments.devices or arguments.device_jobs):
+        parser.error('--tee requires sources to be processed sequentially, it cannot be combined with --devices')
+
+    if arguments.hash_window is not None and not arguments.hash_window:
+        parser.error('--hash-window should be at least 1 byte')
+
+    if arguments.incremental and not arguments.output_db:
+        parser.error('--incremental requires --output-db')
+
 
 def output_to_file(output):
     """
@@ -129,20 +281,93 @@ def output_to_file(output):
     :yield: Nothing, a collecting generator.
     """
     if output:
+        import yaml
+
         # create a generator within a text-io context manager for output
         with open(output, 'w') as stream:
             while True:
                 # receive source name and sink results
                 value = yield
+                spooled = {name: result for name, result in value.items() if isinstance(result, SpooledRecords)}
                 # dump value to output, creating an explicit document start
-                yaml.safe_dump(value, stream=stream, explicit_start=True, sort_keys=False)
+                yaml.safe_dump({name: result for name, result in value.items() if name not in spooled},
+                               stream=stream, explicit_start=True, sort_keys=False)
+                for name, records in spooled.items():
+                    # append records (like window digests or chunks) to the document one at a time, rather than
+                    # dumping a huge list at once (quoted, a hex digest might otherwise be read back as a number)
+                    stream.write('{}:{}\n'.format(name, '' if len(records) else ' []'))
+                    for record in records:
+                        stream.write("- '{}'\n".format(record))
     else:
         while True:
             # do nothing with any value received
             _ = yield  # variable _ is assigned to explicitly to make clear this is a collecting yield
 
 
-def process_source(executor, source, sinks, block_size=1 << 20, progress=None):
+def output_to_database(output, indexed=()):
+    """
+    Collector of dicts to be written to an SQLite database, see
+    digestive.database.ResultStore.
+
+    :param output: The file name of the database to write to.
+    :param indexed: Names of results to index.
+    :yield: Nothing, a collecting generator.
+    """
+    from digestive.database import ResultStore
+
+    # documents are written by a separate thread, closing the store waits for it to finish
+    with ResultStore(output, indexed) as store:
+        while True:
+            store.add((yield))
+
+
+def output_to_all(*outputs):
+    """
+    Collector of dicts to be passed on to several other collectors.
+
+    :param outputs: The collectors to pass values to (already initialized).
+    :yield: Nothing, a collecting generator.
+    """
+    try:
+        while True:
+            value = yield
+            for output in outputs:
+                output.send(value)
+    finally:
+        for output in outputs:
+            output.close()
+
+
+def create_sinks(sink_types, hash_window=None, sink_options=None):
+    """
+    Instantiates sinks for a single source.
+
+    :param sink_types: The sink types to be instantiated.
+    :param hash_window: Window size to wrap hash digests in HashWindows with (or None).
+    :param sink_options: A dict mapping sink types to keyword arguments to instantiate them with (or None).
+    :return: A list of sink instances.
+    """
+    from digestive.stats import ByteStatistics, Statistic
+
+    sink_options = sink_options or {}
+    if any(issubclass(sink, Statistic) for sink in sink_types):
+        # have statistics share a single engine, processed as a sink of its own
+        statistics = ByteStatistics()
+        sinks = [sink(statistics=statistics, **sink_options.get(sink, {})) if issubclass(sink, Statistic)
+                 else sink(**sink_options.get(sink, {}))
+                 for sink in sink_types]
+        sinks.append(statistics)
+    else:
+        sinks = [sink(**sink_options.get(sink, {})) for sink in sink_types]
+    if hash_window:
+        from digestive.hash import HashDigest, HashWindows
+
+        sinks = [HashWindows(sink, hash_window) if isinstance(sink, HashDigest) else sink for sink in sinks]
+
+    return sinks
+
+
+def process_source(executor, source, sinks, block_size=1 << 20, progress=None, pool=None):
     """
     Processes a data source, feeding chunks of at most block_size to each sink in parallel.
 
@@ -151,10 +376,13 @@ def process_source(executor, source, sinks, block_size=1 << 20, progress=None):
     :param sinks: The sink instances to process data chunks with.
     :param block_size: The maximum chunk size to read.
     :param progress: a progress indicator, called with ``set(total_size)`` after each block has been processed
+    :param pool: The BufferPool to draw block buffers from (or None).
     :return: The total number of bytes read.
     """
+    from concurrent.futures import wait
+
     total_size = 0
-    generator = source.blocks(block_size)
+    generator = source.blocks(block_size, pool=pool)
     block = next(generator, False)
     while block:
         total_size += len(block)
@@ -167,17 +395,109 @@ def process_source(executor, source, sinks, block_size=1 << 20, progress=None):
     return total_size
 
 
-def files(sources, recurse=False, followlinks=False):
+def process_inline(source, sinks, buffer=None):
+    """
+    Processes a small data source, reading it in one go and feeding the data to each sink in turn.
+
+    :param source: The data source to read from.
+    :param sinks: The sink instances to process data with.
+    :param buffer: The buffer to read into, expected to fit all of source (or None to read into a new buffer).
+    :return: The total number of bytes read.
+    """
+    if buffer is None:
+        data = source.read()
+        if data:
+            for sink in sinks:
+                sink.process(data)
+
+        return len(data)
+
+    total_size = 0
+    # keep reading in case source has grown beyond the size of buffer
+    num_read = source.readinto(buffer)
+    while num_read:
+        total_size += num_read
+        for sink in sinks:
+            sink.process(buffer[:num_read])
+        num_read = source.readinto(buffer)
+
+    return total_size
+
+
+def collect_results(sinks):
+    """
+    Collects the named results of sinks.
+
+    :param sinks: The sink instances to collect results from.
+    :return: A dict mapping result names to results.
+    """
+    return {name: result for sink in sinks for name, result in sink.results()}
+
+
+def process_batch(sources, sink_factory, pool=None, block_size=1 << 20):
+    """
+    Processes a batch of small data sources inline, intended to be run as a single job on an executor.
+
+    :param sources: The data sources to process.
+    :param sink_factory: Callable creating the sink instances for a single source (see create_sinks).
+    :param pool: The BufferPool to draw a single buffer for the entire batch from (or None).
+    :param block_size: The size of the buffer to draw from pool.
+    :return: A list of tuples (source, size, results, completed) for each source.
+    """
+    buffer = pool.acquire(block_size)[0] if pool else None
+    try:
+        processed = []
+        for source in sources:
+            with source:
+                sinks = sink_factory()
+                size = process_inline(source, sinks, buffer)
+            processed.append((source, size, collect_results(sinks), datetime.now(tz=timezone.utc)))
+    finally:
+        if pool:
+            pool.release(buffer)
+
+    return processed
+
+
+def process_one(source, executor, sink_factory, block_size=1 << 20, inline_size=1 << 20, pool=None):
+    """
+    Processes a single data source, intended to be run concurrently with other sources.
+
+    :param source: The data source to process.
+    :param executor: The executor to submit execution jobs to.
+    :param sink_factory: Callable creating the sink instances for source (see create_sinks).
+    :param block_size: The maximum chunk size to read.
+    :param inline_size: Sources smaller than this are read in one go (see process_inline).
+    :param pool: The BufferPool to draw buffers from (or None).
+    :return: A tuple (size, results, completed).
+    """
+    if not source.streaming and len(source) < inline_size:
+        # process small sources as a batch of one
+        [(_, size, results, completed)] = process_batch([source], sink_factory, pool, block_size)
+        return size, results, completed
+
+    with source:
+        sinks = sink_factory()
+        size = process_source(executor, source, sinks, block_size, pool=pool)
+
+    return size, collect_results(sinks), datetime.now(tz=timezone.utc)
+
+
+def paths(sources, recurse=False, followlinks=False):
     """
     Generates paths to files.
 
     :param sources: The base sources passed as arguments.
     :param recurse: Whether to recurse into directories.
     :param followlinks: Whether to follow symbolic links.
-    :yield: Sources based on the provided arguments.
+    :yield: Paths based on the provided arguments.
     """
     if recurse:
         for source in sources:
+            if source == '-':
+                # stdin is not a directory, but pass it on as-is
+                yield source
+                continue
             # use walk to recurse into each source…
             for base, _, names in walk(source, followlinks=followlinks):
                 # …and yield all the files within them
@@ -188,6 +508,64 @@ def files(sources, recurse=False, followlinks=False):
         yield from sources
 
 
+def files(sources, recurse=False, followlinks=False, archive_depth=0, io_mode='default', expected_size=None):
+    """
+    Generates data sources for files.
+
+    :param sources: The base sources passed as arguments.
+    :param recurse: Whether to recurse into directories.
+    :param followlinks: Whether to follow symbolic links.
+    :param archive_depth: The number of levels of (nested) zip or tar
+        archives to expand into sources for their members (0 to treat
+        archives as regular files).
+    :param io_mode: The I/O mode to read files with (see Source).
+    :param expected_size: The number of bytes expected to be read from stdin.
+    :yield: Sources based on the provided arguments, - being a source reading from stdin.
+    """
+    if archive_depth:
+        from digestive.archive import expand_archives
+
+    for file in paths(sources, recurse, followlinks):
+        if file == '-':
+            # stdin cannot be read more than once, it's never expanded as an archive
+            yield StdinSource(expected_size)
+        elif archive_depth:
+            yield from expand_archives(Source(file, io_mode=io_mode), archive_depth)
+        else:
+            yield Source(file, io_mode=io_mode)
+
+
+def shard(sources, index, count, by='path'):
+    """
+    Deterministically selects a partition of sources, such that running
+    every shard 1…count on the same list of sources processes each of them
+    exactly once.
+
+    :param sources: The sources to partition.
+    :param index: The 1-based index of the shard to select.
+    :param count: The total number of shards.
+    :param by: Either 'path' to partition by a hash of the name of each
+        source, or 'size' to balance the total size of each shard.
+    :yield: The sources in shard index, in their original order.
+    """
+    if by == 'path':
+        # crc32 is stable across processes and machines, unlike hash()
+        yield from (source for source in sources if zlib.crc32(str(source).encode('utf-8')) % count == index - 1)
+    else:
+        # balancing requires knowing all sources up front
+        sources = list(sources)
+        # greedily assign the largest sources to the currently smallest shard (ties broken on name and shard index)
+        shards = [(0, shard) for shard in range(count)]
+        selected = set()
+        for position, source in sorted(enumerate(sources), key=lambda item: (-len(item[1]), str(item[1]))):
+            size, current = heapq.heappop(shards)
+            if current == index - 1:
+                selected.add(position)
+            heapq.heappush(shards, (size + len(source), current))
+
+        yield from (source for position, source in enumerate(sources) if position in selected)
+
+
 class Progress:
     types = {
         # show progress as total bytes processed
@@ -209,11 +587,16 @@ class Progress:
 
     def set(self, num):
         self.value = num
-        if self.end:
-            # progress only makes sense if end > 0
-            self.print_progress()
+        self.print_progress()
 
     def print_progress(self):
+        if not self.end:
+            # size is unknown (or 0 while data is being read), show just the processed bytes
+            print('\033[2K\r  ({value})'.format(
+                value=self.progress(processed=self.value, elapsed=time.monotonic() - self.started),
+            ), end='')
+            return
+
         # use terminal escape to clear line and \r return cursor to start of line, followed by actual progress info
         print('\033[2K\r  {percent:>4.0%} [{bar:<20}] ({value})'.format(
             percent=(self.value / self.end),
@@ -225,6 +608,86 @@ class Progress:
         print('\033[2K\r', end='')
 
 
+def print_header(source, size):
+    """
+    Prints the name and size of a source to the console.
+
+    :param source: The source to print a header for.
+    :param size: The size of source.
+    """
+    if source.streaming and not size:
+        description = 'unknown size'
+    else:
+        description = file_size(size)
+    # flush status line to force it to show in something like | less
+    print('{} ({})'.format(source, description), flush=True)
+
+
+def report(output, source, size, results, completed):
+    """
+    Reports the results of processing a single source to the console and output collector.
+
+    :param output: The output collector to send results to.
+    :param source: The processed source.
+    :param size: The number of bytes read from source.
+    :param results: The results of the sinks for source (see collect_results).
+    :param completed: The time processing source was completed.
+    """
+    for name, result in results.items():
+        if result is not None:  # exclude Nones from results
+            print('  {:<12} {}'.format(name, result))
+
+    # create meta data leader
+    # TODO: using kwargs here would be nice, but that destroys order :( (see PEP-468)
+    info = {'source': str(source),
+            'size': size,
+            'modified': source.modified,
+            'completed': completed}
+    # add results
+    info.update(results)
+    # send info to the output collector
+    output.send(info)
+
+
+def submit_batch(executor, job, batch, previous, output, pending):
+    """
+    Submits a batch of small sources as a single job. Members of an archive
+    share the archive's stream, batches of members of the same archive are
+    processed one after the other rather than concurrently, avoiding
+    (compressed) archives to be rewound for every batch.
+
+    :param executor: The executor to submit the batch to.
+    :param job: Callable to process a batch with.
+    :param batch: The sources to process.
+    :param previous: The batch submitted before this one (or None).
+    :param output: The output collector to send results to.
+    :param pending: A deque of futures for batches, the future for batch is appended.
+    :return: batch, to be passed as previous for the next batch.
+    """
+    container = getattr(batch[0], 'container', None)
+    if container is not None and previous and getattr(previous[-1], 'container', None) is container:
+        # wait for the previous batch of members, it's read from the same archive
+        report_batches(output, pending)
+
+    pending.append(executor.submit(job, batch))
+    return batch
+
+
+def report_batches(output, pending, wait=True, keep=0):
+    """
+    Reports the results of batches of small sources, in the order the batches were submitted.
+
+    :param output: The output collector to send results to.
+    :param pending: A deque of futures for batches, reported batches are removed.
+    :param wait: Whether to wait for batches to complete, or to stop at the first batch that has not completed.
+    :param keep: The number of most recently submitted batches to leave pending.
+    """
+    while len(pending) > keep and (wait or pending[0].done()):
+        for source, size, results, completed in pending.popleft().result():
+            print_header(source, size)
+            report(output, source, size, results, completed)
+
+
 def main(arguments=None):
     """
     Runs digestive.
@@ -232,44 +695,152 @@ def main(arguments=None):
     :param arguments: Commandline arguments, passed to parse_arguments.
     """
     arguments = parse_arguments(arguments)
-    # create the output generator
-    output = output_to_file(arguments.output)
-    # initialize output (moves it to the first occurrence of yield)
-    next(output)
+    # create the output generators
+    outputs = [output_to_file(arguments.output)]
+    if arguments.output_db:
+        from digestive.hash import HashDigest
+
+        # index hash digests for lookups, other results (like statistics or lists of chunks) are not worth it
+        indexed = [sink().name for sink in arguments.sinks if issubclass(sink, HashDigest)]
+        outputs.append(output_to_database(arguments.output_db, indexed))
+    output = output_to_all(*outputs)
+    # initialize outputs (moves them to the first occurrence of yield)
+    for collector in outputs + [output]:
+        next(collector)
     info = {'digestive': str(digestive.__version__),
             'started': datetime.now(tz=timezone.utc)}
+    sources = files(arguments.sources, arguments.recursive, archive_depth=arguments.archive_depth,
+                    io_mode=arguments.io_mode, expected_size=arguments.expected_size)
+    if arguments.hash_window:
+        info['hash-window'] = arguments.hash_window
+    if arguments.shard:
+        info['shard'] = '{}/{}'.format(*arguments.shard)
+        sources = shard(sources, *arguments.shard, by=arguments.shard_by)
+    sink_options = {}
+    index = None
+    if any(sink.__module__ == 'digestive.chunking' for sink in arguments.sinks):
+        from digestive.chunking import Chunks, ChunkIndex, ChunkSummary
+
+        min_size, avg_size, max_size = arguments.chunk_sizes
+        sink_options[Chunks] = {'min_size': min_size, 'avg_size': avg_size, 'max_size': max_size}
+        # chunk summaries share an index for the entire run
+        index = ChunkIndex()
+        sink_options[ChunkSummary] = dict(sink_options[Chunks], index=index)
+    if arguments.incremental:
+        from digestive.database import known_sources
+
+        # skip sources that were processed in an earlier run, assuming they're unchanged if size and modification
+        # time are the same, as long as all results requested now were recorded for them
+        names = list(collect_results(create_sinks(arguments.sinks, arguments.hash_window, sink_options)))
+        known = known_sources(arguments.output_db, names)
+        sources = (source for source in sources
+                   if source.streaming or known.get(str(source)) != (len(source), source.modified))
+    if arguments.archive_depth:
+        from digestive.archive import close_archives
+
+        # close archives as soon as their members have been processed, leaving them open would run out of files
+        sources = close_archives(sources)
     output.send(info)
 
-    with ThreadPoolExecutor(arguments.jobs) as executor:
-        for file in files(arguments.sources, arguments.recursive):
-            with Source(file) as source:
-                # instantiate sinks from requested types
-                sinks = [sink() for sink in arguments.sinks]
-                # flush initial status line to force it to show in something like | less
-                print('{} ({})'.format(source, file_size(len(source))), flush=True)
-
-                if arguments.progress and sys.stdout.isatty():
-                    with Progress(source, arguments.progress) as progress:
-                        size = process_source(executor, source, sinks, arguments.block_size, progress=progress)
-                else:
-                    size = process_source(executor, source, sinks, arguments.block_size)
-
-                results = {sink.name: sink.result() for sink in sinks}
-                for name, result in results.items():
-                    if result is not None:  # exclude Nones from results
-                        print('  {:<12} {}'.format(name, result))
-
-                # create meta data leader
-                # TODO: using kwargs here would be nice, but that destroys order :( (see PEP-468)
-                info = {'source': file,
-                        'size': size,
-                        'completed': datetime.now(tz=timezone.utc)}
-                # add results
-                info.update(results)
-                # send info to the output collector
-                output.send(info)
-
-    # close the output collector, which in turn closes the output stream
+    sink_types = arguments.sinks
+    # block buffers are drawn from a single pool for all sources
+    pool = BufferPool(arguments.max_memory)
+    # sources smaller than a single block are read in one go, except for O_DIRECT which requires aligned buffers
+    inline_size = 0 if arguments.io_mode == 'direct' else arguments.block_size
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ExitStack() as stack:
+        if arguments.tee:
+            from digestive.io import Tee
+
+            if arguments.tee == '-':
+                # stdout is reserved for data, move console output to stderr
+                sink_options[Tee] = {'stream': sys.stdout.buffer}
+                stack.enter_context(redirect_stdout(sys.stderr))
+            else:
+                stream = stack.enter_context(open(arguments.tee, 'wb'))  # noqa: SIM115 (closed by stack)
+                sink_options[Tee] = {'stream': stream}
+            sink_types = sink_types + [Tee]
+            # data is to be copied in order, process every source in sequence
+            inline_size = 0
+
+        sink_factory = partial(create_sinks, sink_types, arguments.hash_window, sink_options)
+        process_batch_job = partial(process_batch, sink_factory=sink_factory, pool=pool,
+                                    block_size=arguments.block_size)
+
+        if arguments.devices or arguments.device_jobs:
+            from digestive.schedule import DeviceScheduler
+
+            # sources on different devices are processed concurrently, report them as they complete (without progress)
+            scheduler = DeviceScheduler(dict(arguments.device_jobs or ()), ssd_jobs=arguments.ssd_jobs)
+            queues = scheduler.queue(sources)
+            # every reader feeds its own sinks, allow each of them to use up to jobs threads
+            executor = stack.enter_context(ThreadPoolExecutor(arguments.jobs * max(scheduler.readers(queues), 1)))
+            process = partial(process_one, executor=executor, sink_factory=sink_factory,
+                              block_size=arguments.block_size, inline_size=inline_size, pool=pool)
+            for source, (size, results, completed) in scheduler.run(queues, process):
+                print_header(source, size)
+                report(output, source, size, results, completed)
+        else:
+            executor = stack.enter_context(ThreadPoolExecutor(arguments.jobs))
+            # small sources are collected into batches, each processed as a single job, keeping enough batches
+            # pending to keep all threads busy
+            batch, previous, pending = [], None, deque()
+            max_pending = 2 * arguments.jobs
+            for source in sources:
+                size = len(source)
+                if not source.streaming and size < inline_size:
+                    batch.append(source)
+                    if len(batch) >= _batch_size:
+                        previous = submit_batch(executor, process_batch_job, batch, previous, output, pending)
+                        batch = []
+                        # limit the number of batches (and the sources in them) waiting for a thread
+                        report_batches(output, pending, keep=max_pending)
+                    # report batches that have completed in the mean time
+                    report_batches(output, pending, wait=False)
+                    continue
+
+                # report any small sources that came before this one first
+                if batch:
+                    previous = submit_batch(executor, process_batch_job, batch, previous, output, pending)
+                    batch = []
+                report_batches(output, pending)
+
+                with source:
+                    # instantiate sinks from requested types
+                    sinks = sink_factory()
+                    # print initial status line before processing starts
+                    print_header(source, size)
+
+                    if arguments.progress and sys.stdout.isatty():
+                        with Progress(source, arguments.progress) as progress:
+                            size = process_source(executor, source, sinks, arguments.block_size,
+                                                  progress=progress, pool=pool)
+                    else:
+                        size = process_source(executor, source, sinks, arguments.block_size, pool=pool)
+
+                    if source.streaming and arguments.expected_size is not None and size != arguments.expected_size:
+                        print('  warning: expected {} bytes, read {}'.format(arguments.expected_size, size),
+                              file=sys.stderr)
+                    report(output, source, size, collect_results(sinks), datetime.now(tz=timezone.utc))
+
+            if batch:
+                submit_batch(executor, process_batch_job, batch, previous, output, pending)
+            report_batches(output, pending)
+
+        if index is not None:
+            summary = index.summary()
+            print('chunk summary')
+            for name, value in summary.items():
+                print('  {:<12} {}'.format(name, value))
+            output.send({'chunk-summary': summary})
+
+        if arguments.max_memory:
+            print('buffer pool: {hits} hits, {misses} misses, {waits} waits, peak {peak}'.format(
+                **dict(pool.stats(), peak=file_size(pool.peak))))
+
+    # close the output collector, which in turn closes the output streams
     output.close()
 
 
@@ -0,0 +1,81 @@
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+import sys
+
+import yaml
+
+import digestive
+
+
+def parse_arguments(arguments=None):
+    """
+    Parses commandline arguments for digestive-merge.
+
+    :param arguments: The arguments to parse, or None. Arguments will be read from sys.argv if None.
+    :return: An argparse.Namespace object.
+    """
+    parser = ArgumentParser(description='merge yaml-encoded output of (sharded) digestive runs')
+    parser.add_argument('-o', '--output',
+                        help='write merged output to file (defaults to stdout)')
+    parser.add_argument('inputs', metavar='FILE', nargs='+',
+                        help='output files of digestive runs')
+
+    return parser.parse_args(arguments)
+
+
+def merge(streams):
+    """
+    Merges the documents written by several digestive runs into a single
+    ordered document stream.
+
+    :param streams: Iterable of streams (or strings) containing the
+        yaml-encoded output of a digestive run.
+    :yield: A leading info document, followed by all source documents
+        ordered by source and any other documents in the order they were
+        encountered.
+    """
+    infos, sources, others = [], [], []
+    for stream in streams:
+        documents = yaml.safe_load_all(stream)
+        # every run starts with a single info document…
+        infos.append(next(documents, None) or {})
+        for document in documents:
+            # …followed by documents for each source and possibly run summaries
+            if isinstance(document, dict) and 'source' in document:
+                sources.append(document)
+            else:
+                others.append(document)
+
+    started = [info['started'] for info in infos if 'started' in info]
+    info = {'digestive': str(digestive.__version__),
+            'started': min(started) if started else None,
+            'merged': datetime.now(tz=timezone.utc),
+            'shards': [info.get('shard') for info in infos]}
+
+    yield info
+    yield from sorted(sources, key=lambda document: str(document['source']))
+    yield from others
+
+
+def main(arguments=None):
+    """
+    Runs digestive-merge.
+
+    :param arguments: Commandline arguments, passed to parse_arguments.
+    """
+    arguments = parse_arguments(arguments)
+
+    streams = [open(name) for name in arguments.inputs]  # noqa: SIM115 (closed below)
+    try:
+        if arguments.output:
+            with open(arguments.output, 'w') as output:
+                yaml.safe_dump_all(merge(streams), stream=output, explicit_start=True, sort_keys=False)
+        else:
+            yaml.safe_dump_all(merge(streams), stream=sys.stdout, explicit_start=True, sort_keys=False)
+    finally:
+        for stream in streams:
+            stream.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+from os import path
+from queue import Queue
+from threading import Event
+
+
+def rotational(device):
+    """
+    Determines whether a device is a rotational disk, using sysfs (Linux).
+
+    :param device: The device ID (st_dev of a file on it, or st_rdev of a device node).
+    :return: True for a rotational disk, False for a non-rotational disk, None if unknown.
+    """
+    if device is None:
+        return None
+
+    base = '/sys/dev/block/{}:{}'.format(os.major(device), os.minor(device))
+    # partitions don't carry queue information themselves, their parent disk does
+    for queue in (path.join(base, 'queue', 'rotational'), path.join(base, '..', 'queue', 'rotational')):
+        try:
+            with open(queue) as file:
+                return file.read().strip() == '1'
+        except OSError:
+            continue
+
+    return None
+
+
+def device_of(name):
+    """
+    Determines the device ID for a path, being either a device node or any
+    file on a device.
+
+    :param name: The path to determine the device ID for.
+    :return: A device ID.
+    """
+    stat = os.stat(name)
+    if stat.st_rdev:
+        # block device node, refer to the device itself rather than the file system containing /dev
+        return stat.st_rdev
+    return stat.st_dev
+
+
+class DeviceScheduler:
+    """
+    Processes sources concurrently, limiting the number of sources being
+    read at the same time for each device.
+    """
+
+    def __init__(self, limits=None, hdd_jobs=1, ssd_jobs=4):
+        """
+        :param limits: A dict mapping device IDs to the number of concurrent
+            readers for that device (or None).
+        :param hdd_jobs: The number of concurrent readers for rotational
+            disks and devices of unknown type.
+        :param ssd_jobs: The number of concurrent readers for non-rotational
+            devices.
+        """
+        self.limits = limits or {}
+        self.hdd_jobs = hdd_jobs
+        self.ssd_jobs = ssd_jobs
+
+    def limit(self, device):
+        """
+        Determines the number of concurrent readers for a device.
+
+        :param device: The device ID.
+        :return: The number of sources to read concurrently from device.
+        """
+        if device in self.limits:
+            return self.limits[device]
+        # unknown devices get the conservative limit, avoiding seek storms
+        return self.ssd_jobs if rotational(device) is False else self.hdd_jobs
+
+    def queue(self, sources):
+        """
+        Queues sources by the device they reside on. Consecutive members of
+        the same archive are queued as a single unit, to be read in order by
+        a single reader (readers sharing an archive would take turns
+        rewinding its compressed stream).
+
+        :param sources: The sources to process.
+        :return: A dict mapping device IDs to a deque of units on that
+            device, each a list of sources.
+        """
+        queues = {}
+        last = None
+        for source in sources:
+            queue = queues.setdefault(source.device, deque())
+            archive = _archive(source)
+            if archive is not None and archive is last and queue:
+                queue[-1].append(source)
+            else:
+                queue.append([source])
+            last = archive
+
+        return queues
+
+    def readers(self, queues):
+        """
+        Determines the number of sources that will be read concurrently.
+
+        :param queues: Sources queued by device (see queue).
+        :return: The total number of readers for all devices.
+        """
+        return sum(min(self.limit(device), len(queue)) for device, queue in queues.items())
+
+    def run(self, queues, process):
+        """
+        Processes sources, reading from different devices in parallel while
+        respecting the limit for each device.
+
+        :param queues: Sources queued by device (see queue).
+        :param process: Callable to process a single source with.
+        :yield: Tuples (source, result) in order of completion, an exception
+            raised by process is re-raised when its source is up.
+        """
+        workers = [queue for device, queue in queues.items() for _ in range(min(self.limit(device), len(queue)))]
+        if not workers:
+            return
+
+        done = Queue()
+        stopped = Event()
+        with ThreadPoolExecutor(len(workers)) as executor:
+            for queue in workers:
+                executor.submit(self._work, queue, process, done, stopped)
+
+            running = len(workers)
+            try:
+                while running:
+                    source, outcome = done.get()
+                    if source is None:
+                        # a worker ran out of sources
+                        running -= 1
+                    else:
+                        # outcome.result re-raises any exception raised by process
+                        yield source, outcome.result()
+            finally:
+                # stop workers from picking up new sources when stopped early
+                stopped.set()
+                for queue in queues.values():
+                    queue.clear()
+
+    def _work(self, queue, process, done, stopped):
+        try:
+            while True:
+                try:
+                    # deque.popleft is thread-safe, workers for the same device can share queue
+                    unit = queue.popleft()
+                except IndexError:
+                    break
+
+                for source in unit:
+                    if stopped.is_set():
+                        return
+
+                    outcome = Future()
+                    try:
+                        outcome.set_result(process(source))
+                    except Exception as e:
+                        outcome.set_exception(e)
+                    done.put((source, outcome))
+        finally:
+            done.put((None, None))
+
+
+def _archive(source):
+    # the outermost archive container a member of (nested) archives is read from, None for any other source
+    container = None
+    while hasattr(source, 'container'):
+        container = source.container
+        source = container.source
+    return container
@@ -0,0 +1,214 @@
+from collections import Counter
+from functools import lru_cache
+from itertools import compress
+from math import log2
+from operator import mul
+from struct import unpack_from
+
+from digestive.io import Sink
+
+
+# Monte Carlo points are made from 6 bytes: 24-bit x and y coordinates
+_point_size = 6
+# squared radius of the circle inscribed in the 24-bit square
+_radius = ((1 << 24) - 1) ** 2
+
+
+@lru_cache(maxsize=None)
+def _cells():
+    # divide the square into 256×256 cells by the high bytes of x and y, keyed like points in ByteStatistics._points:
+    # a list of flags for cells fully inside the circle and a bytearray of flags for cells crossing its boundary
+    inside, boundary = [0] * (1 << 16), bytearray(1 << 16)
+    for x_high in range(256):
+        for y_high in range(256):
+            key = x_high | y_high << 8
+            if ((x_high << 16) | 0xffff) ** 2 + ((y_high << 16) | 0xffff) ** 2 <= _radius:
+                inside[key] = 1
+            elif (x_high << 16) ** 2 + (y_high << 16) ** 2 <= _radius:
+                boundary[key] = 1
+
+    return inside, boundary
+
+
+class ByteStatistics(Sink):
+    """
+    Statistics engine, collecting a histogram and other statistics of data
+    in a single pass, to be shared between Statistic sinks.
+
+    Statistics that are costly to collect are only collected when enabled
+    (see enable).
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__('statistics', **kwargs)
+        self.features = set()
+        self.length = 0
+        self.counter = Counter()
+        # state for serial correlation: first and last byte seen, sum of products of consecutive bytes
+        self.first = None
+        self.last = None
+        self.serial = 0
+        # state for Monte Carlo: bytes of an incomplete point, number of points and those inside the circle
+        self.pending = b''
+        self.points = 0
+        self.inside = 0
+
+    def enable(self, *features):
+        """
+        Enables collecting additional statistics.
+
+        :param features: Names of features to enable: 'serial' (for serial
+            correlation) and / or 'montecarlo' (for Monte Carlo pi).
+        """
+        self.features.update(features)
+
+    def process(self, data):
+        if not len(data):
+            return
+
+        self.length += len(data)
+        self.counter.update(data)
+
+        if 'serial' in self.features:
+            if self.last is None:
+                self.first = data[0]
+            else:
+                # correlate with the last byte of the previous block
+                self.serial += self.last * data[0]
+            self.serial += sum(map(mul, data[:-1], data[1:]))
+            self.last = data[-1]
+
+        if 'montecarlo' in self.features:
+            data = memoryview(data)
+            if self.pending:
+                # complete the point started at the end of the previous block
+                needed = _point_size - len(self.pending)
+                self.pending, data = self.pending + bytes(data[:needed]), data[needed:]
+                if len(self.pending) == _point_size:
+                    self._points(self.pending)
+                    self.pending = b''
+
+            usable = len(data) - len(data) % _point_size
+            self._points(data[:usable])
+            self.pending += bytes(data[usable:])
+
+    def _points(self, data):
+        count = len(data) // _point_size
+        # combine the high bytes of x and y of every point into the 16-bit key of the cell containing it (byte order
+        # of the key doesn't matter, the circle is symmetric in x and y)
+        keys = bytearray(2 * count)
+        keys[0::2] = bytes(data[0::_point_size])
+        keys[1::2] = bytes(data[3::_point_size])
+        keys = memoryview(keys).cast('H')
+
+        inside, boundary = _cells()
+        self.points += count
+        # avoid looking at the exact coordinates of points in cells fully inside (or outside) of the circle…
+        self.inside += sum(map(inside.__getitem__, keys))
+        # …leaving only the few points in cells crossing the boundary of the circle to be checked individually
+        for offset in compress(range(0, count * _point_size, _point_size), map(boundary.__getitem__, keys)):
+            x_high, x_low, y_high, y_low = unpack_from('>BHBH', data, offset)
+            x, y = x_high << 16 | x_low, y_high << 16 | y_low
+            self.inside += x * x + y * y <= _radius
+
+    def result(self):
+        return None
+
+    def results(self):
+        # statistics are reported by the sinks sharing this engine
+        yield from ()
+
+    def entropy(self):
+        # calculate binary entropy as -Σ(1…n) p_i × log₂(p_i)
+        return -sum(count / self.length * log2(count / self.length) for count in self.counter.values())
+
+    def chi_square(self):
+        # calculate χ² for a uniform distribution of byte values as Σ(0…255) (count_i - expected)² / expected
+        expected = self.length / 256
+        return sum((self.counter[value] - expected) ** 2 / expected for value in range(256))
+
+    def mean(self):
+        return sum(value * count for value, count in self.counter.items()) / self.length
+
+    def monte_carlo_pi(self):
+        # fraction of points inside the circle inscribed in the square approximates π / 4
+        return 4 * self.inside / self.points
+
+    def serial_correlation(self):
+        # wrap around, correlating the last byte with the first
+        products = self.serial + self.last * self.first
+        total = sum(value * count for value, count in self.counter.items())
+        squares = sum(value * value * count for value, count in self.counter.items())
+        denominator = self.length * squares - total * total
+        if not denominator:
+            # correlation is undefined for constant data
+            return None
+
+        return (self.length * products - total * total) / denominator
+
+
+class Statistic(Sink):
+    """
+    Base class for sinks deriving their result from ByteStatistics.
+    """
+
+    # features of ByteStatistics required by this sink
+    requires = ()
+
+    def __init__(self, name, statistics=None, **kwargs):
+        """
+        :param name: The name of this sink.
+        :param statistics: A ByteStatistics instance shared with other sinks,
+            to be processed separately. A private instance is processed by
+            this sink if None.
+        :param kwargs: Keyword arguments passed on to Sink.
+        """
+        super().__init__(name, **kwargs)
+        self.shared = statistics is not None
+        self.statistics = statistics if self.shared else ByteStatistics()
+        self.statistics.enable(*self.requires)
+
+    def process(self, data):
+        if not self.shared:
+            self.statistics.process(data)
+
+
+class ChiSquare(Statistic):
+    def __init__(self, **kwargs):
+        super().__init__('chi-square', **kwargs)
+
+    def result(self):
+        if self.statistics.length:
+            return '{:.2f}'.format(self.statistics.chi_square())
+
+
+class Mean(Statistic):
+    def __init__(self, **kwargs):
+        super().__init__('mean', **kwargs)
+
+    def result(self):
+        if self.statistics.length:
+            return '{:.8f}'.format(self.statistics.mean())
+
+
+class MonteCarloPi(Statistic):
+    requires = ('montecarlo',)
+
+    def __init__(self, **kwargs):
+        super().__init__('monte-carlo-pi', **kwargs)
+
+    def result(self):
+        if self.statistics.points:
+            return '{:.8f}'.format(self.statistics.monte_carlo_pi())
+
+
+class SerialCorrelation(Statistic):
+    requires = ('serial',)
+
+    def __init__(self, **kwargs):
+        super().__init__('serial-correlation', **kwargs)
+
+    def result(self):
+        if self.statistics.length:
+            value = self.statistics.serial_correlation()
+            return 'undefined' if value is None else '{:.8f}'.format(value)
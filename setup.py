@@ -25,7 +25,8 @@ setup(
     ),
     entry_points={
         'console_scripts': {
-            'digestive = digestive.main:main'
+            'digestive = digestive.main:main',
+            'digestive-merge = digestive.merge:main',
         }
     }
 )
@@ -0,0 +1,175 @@
+import io
+import os
+from os import path
+import tarfile
+import zipfile
+
+from unittest.mock import patch
+
+from digestive.archive import ArchiveMemberSource, close_archives, expand_archives, open_archive
+from digestive.hash import MD5
+from digestive.io import Source
+
+
+here = path.dirname(path.abspath(__file__))
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _tar(members, mode='w'):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_not_an_archive():
+    source = Source(path.join(here, 'files/1234'))
+
+    assert list(expand_archives(source)) == [source]
+    assert list(expand_archives(source, depth=0)) == [source]
+
+
+def test_not_an_archive_image(tmp_path):
+    # tarfile reads data starting with a zero block as an empty tar archive
+    zeroes = tmp_path / 'zeroes.img'
+    zeroes.write_bytes(bytes(4096))
+    prefixed = tmp_path / 'prefixed.img'
+    prefixed.write_bytes(bytes(1024) + bytes(range(256)) * 16)
+    # zipfile recognizes a zip at the end of data
+    trailing = tmp_path / 'trailing.img'
+    trailing.write_bytes(bytes(range(256)) * 16 + _zip({'readme': b'hi'}))
+
+    for image in (zeroes, prefixed, trailing):
+        source = Source(str(image))
+        assert list(expand_archives(source)) == [source]
+
+
+def test_empty_archive(tmp_path):
+    empty_zip = tmp_path / 'empty.zip'
+    empty_zip.write_bytes(_zip({}))
+    empty_tar = tmp_path / 'empty.tar'
+    empty_tar.write_bytes(_tar({}))
+
+    # archives without members are processed as regular files, rather than dropped
+    for archive in (empty_zip, empty_tar):
+        source = Source(str(archive))
+        assert list(expand_archives(source)) == [source]
+
+
+def test_truncated_archive(tmp_path):
+    archive = tmp_path / 'truncated.tar.gz'
+    data = _tar({'member{}'.format(i): os.urandom(1 << 10) for i in range(10)}, mode='w:gz')
+    archive.write_bytes(data[:len(data) // 2])
+
+    source = Source(str(archive))
+    assert list(expand_archives(source)) == [source]
+
+
+def test_zip(tmp_path):
+    archive = tmp_path / 'archive.zip'
+    archive.write_bytes(_zip({'1234': b'\x01\x02\x03\x04', 'empty': b''}))
+
+    sources = list(close_archives(expand_archives(Source(str(archive)))))
+
+    assert [str(source) for source in sources] == ['{}!1234'.format(archive), '{}!empty'.format(archive)]
+    assert [len(source) for source in sources] == [4, 0]
+
+    with sources[0] as source:
+        assert b''.join(source.blocks(3)) == b'\x01\x02\x03\x04'
+
+    assert sources[0].fd is None
+    # archive is kept open for the other members, until all of them have been processed
+    container = sources[0].archive
+    assert container.fd is not None
+    with sources[1] as source:
+        assert source.read() == b''
+    assert container.fd is None
+
+
+def test_container_opened_once(tmp_path):
+    archive = tmp_path / 'archive.tar.gz'
+    archive.write_bytes(_tar({'member{}'.format(i): bytes([i]) * 3 for i in range(10)}, mode='w:gz'))
+
+    sources = list(expand_archives(Source(str(archive))))
+    with patch('digestive.archive.open_archive', wraps=open_archive) as opened:
+        for i, source in enumerate(sources):
+            with source:
+                assert source.read() == bytes([i]) * 3
+
+    # all members are read from a single opened archive
+    assert opened.call_count == 1
+
+
+def test_close_archives(tmp_path):
+    archives = []
+    for name in ('first', 'second'):
+        archives.append(tmp_path / '{}.tar.gz'.format(name))
+        archives[-1].write_bytes(_tar({'member{}'.format(i): bytes([i]) * 3 for i in range(3)}, mode='w:gz'))
+
+    sources = close_archives(source for archive in archives for source in expand_archives(Source(str(archive))))
+    first = [next(sources) for _ in range(3)]
+    for source in first:
+        with source:
+            source.read()
+    # all members of the first archive have been processed, but more of them might follow
+    assert first[0].archive.fd is not None
+
+    second = list(sources)
+    assert first[0].archive.fd is None
+    for source in second:
+        with source:
+            source.read()
+    assert second[0].archive.fd is None
+
+
+def test_nested(tmp_path):
+    inner = _zip({'1234': b'\x01\x02\x03\x04'})
+    archive = tmp_path / 'archive.tar.gz'
+    archive.write_bytes(_tar({'inner.zip': inner, 'plain': b'plain'}, mode='w:gz'))
+
+    # without nesting, the inner zip is a regular member
+    sources = list(expand_archives(Source(str(archive))))
+    assert [source.member for source in sources] == ['inner.zip', 'plain']
+
+    sources = list(close_archives(expand_archives(Source(str(archive)), depth=2)))
+    assert [str(source) for source in sources] == ['{}!inner.zip!1234'.format(archive), '{}!plain'.format(archive)]
+    assert isinstance(sources[0].archive, ArchiveMemberSource)
+
+    sink = MD5()
+    with sources[0] as source:
+        for block in source.blocks(2):
+            sink.process(block)
+
+    # md5sum files/1234
+    assert sink.result() == '08d6c05a21512a79a1dfeb9d2a8f262f'
+    # the inner archive is closed, the outer archive is held open for its other member
+    assert sources[0].archive.fd is None
+    assert sources[1].archive.fd is not None
+    with sources[1] as source:
+        assert source.read() == b'plain'
+    assert sources[1].archive.fd is None
+
+
+def test_direct(tmp_path):
+    archive = tmp_path / 'archive.zip'
+    archive.write_bytes(_zip({'1234': b'\x01\x02\x03\x04'}))
+
+    # O_DIRECT is unsuitable for reading archives
+    [member] = expand_archives(Source(str(archive), io_mode='direct'))
+    assert member.archive.io_mode == 'nocache'
+    with member:
+        assert member.read() == b'\x01\x02\x03\x04'
+
+    # regular files are still read using O_DIRECT
+    [source] = expand_archives(Source(path.join(here, 'files/1234'), io_mode='direct'))
+    assert source.io_mode == 'direct'
@@ -0,0 +1,102 @@
+import hashlib
+import random
+
+from digestive.chunking import ChunkIndex, Chunks, ChunkSummary
+
+
+def _data(size, seed=42):
+    return random.Random(seed).getrandbits(size * 8).to_bytes(size, 'little')
+
+
+def _chunks(data, block_size, **kwargs):
+    sink = Chunks(**kwargs)
+    for offset in range(0, len(data), block_size):
+        sink.process(data[offset:offset + block_size])
+    return list(sink.result())
+
+
+def test_empty():
+    sink = Chunks()
+    sink.process(b'')
+
+    assert list(sink.result()) == []
+    assert str(sink.result()) == '0 chunks'
+
+
+def test_small():
+    sink = Chunks()
+    sink.process(b'\x01\x02\x03\x04')
+
+    # sha256sum files/1234
+    assert list(sink.result()) == ['0+4 9f64a747e1b97f131fabb6b447296c9b6f0201e79fb3c5356e6c77e89b6a806a']
+    assert list(sink.result().chunks()) == [(0, 4, '9f64a747e1b97f131fabb6b447296c9b6f0201e79fb3c5356e6c77e89b6a806a')]
+
+
+def test_block_boundaries():
+    data = _data(256 << 10)
+    chunks = _chunks(data, len(data), min_size=1024, avg_size=4096, max_size=16384)
+
+    # chunk boundaries don't depend on the blocks the data is processed in
+    assert _chunks(data, 1000, min_size=1024, avg_size=4096, max_size=16384) == chunks
+    assert _chunks(data, 4096, min_size=1024, avg_size=4096, max_size=16384) == chunks
+
+    offset = 0
+    for chunk in chunks:
+        position, digest = chunk.split(' ')
+        start, length = (int(value) for value in position.split('+'))
+        assert start == offset
+        assert 1024 <= length <= 16384 or chunk is chunks[-1]
+        assert hashlib.sha256(data[start:start + length]).hexdigest() == digest
+        offset += length
+
+    assert offset == len(data)
+    # average chunk size should be somewhat near the requested average
+    assert 2048 < len(data) / len(chunks) < 8192
+
+
+def test_max_size():
+    # constant data never produces a cut point, chunks are cut at max_size
+    chunks = _chunks(b'\x00' * 10000, 3000, min_size=64, avg_size=256, max_size=1024)
+
+    expected = ['{}+1024'.format(offset) for offset in range(0, 9216, 1024)] + ['9216+784']
+    assert [chunk.split(' ')[0] for chunk in chunks] == expected
+
+
+def test_spooled():
+    sink = Chunks(min_size=1, avg_size=1, max_size=1)
+    data = bytes(range(256)) * 128
+    sink.process(data)
+
+    # 32 Ki chunks of a single byte spill their records to disk
+    chunks = sink.result()
+    assert len(chunks) == len(data)
+    assert list(chunks)[-1] == '{}+1 {}'.format(len(data) - 1, hashlib.sha256(b'\xff').hexdigest())
+
+
+def test_content_defined():
+    data = _data(128 << 10)
+    chunks = {chunk.split(' ')[1] for chunk in _chunks(data, 1 << 20)}
+    shifted = {chunk.split(' ')[1] for chunk in _chunks(b'inserted' + data, 1 << 20)}
+
+    # inserting data at the start only affects the first chunk
+    assert len(chunks - shifted) == 1
+
+
+def test_summary():
+    data = _data(64 << 10)
+    index = ChunkIndex()
+
+    first, second = ChunkSummary(index=index), ChunkSummary(index=index)
+    first.process(data)
+    second.process(data)
+    second.process(data)
+
+    assert first.result() == '{0} chunks, {0} new'.format(first.num_chunks)
+    assert second.result() == '{} chunks, {} new'.format(second.num_chunks, second.new_chunks)
+    # only chunks around the point where data is repeated are new
+    assert second.new_chunks <= 2
+    summary = index.summary()
+    assert summary['bytes'] == 3 * len(data)
+    assert summary['unique chunks'] == first.num_chunks + second.new_chunks
+    # data was seen three times, minus the chunks around the point where data is repeated
+    assert float(summary['dedup ratio']) > 1.5
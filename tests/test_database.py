@@ -0,0 +1,156 @@
+from datetime import datetime, timezone
+import hashlib
+import sqlite3
+from tempfile import SpooledTemporaryFile
+
+import pytest
+
+from digestive.chunking import Chunks
+from digestive.database import known_sources, ResultStore
+from digestive.hash import HashWindows, MD5, WindowDigests
+
+
+def test_result_store(tmp_path):
+    database = str(tmp_path / 'results.db')
+    with ResultStore(database, indexed=['md5'], batch_size=2) as store:
+        store.add({'digestive': '0.1', 'started': datetime(2020, 1, 1, tzinfo=timezone.utc)})
+        store.add({'source': 'a', 'size': 4, 'completed': datetime(2020, 1, 2, tzinfo=timezone.utc),
+                   'md5': '08d6c05a21512a79a1dfeb9d2a8f262f', 'chunks': ['short']})
+        store.add({'source': 'b', 'size': 0, 'completed': datetime(2020, 1, 3, tzinfo=timezone.utc),
+                   'md5': 'd41d8cd98f00b204e9800998ecf8427e', 'md5-windows': ['d41d8cd98f00b204e9800998ecf8427e']})
+        store.add({'chunk-summary': {'chunks': 0}})
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT digestive, started FROM runs').fetchall() == [
+            ('0.1', '2020-01-01T00:00:00+00:00')]
+        rows = connection.execute('SELECT run, source, size, md5, "md5-windows" FROM sources ORDER BY id').fetchall()
+        assert rows == [
+            (1, 'a', 4, '08d6c05a21512a79a1dfeb9d2a8f262f', None),
+            (1, 'b', 0, 'd41d8cd98f00b204e9800998ecf8427e', '["d41d8cd98f00b204e9800998ecf8427e"]'),
+        ]
+        assert connection.execute('SELECT run, summary FROM summaries').fetchall() == [
+            (1, '{"chunk-summary": {"chunks": 0}}')]
+
+        indexes = {row[1] for row in connection.execute('PRAGMA index_list(sources)')}
+        # only the requested results are indexed, regardless of their values
+        assert indexes == {'sources_source', 'sources_size', 'sources_md5'}
+
+
+def test_result_store_windows(tmp_path):
+    sink = HashWindows(MD5(), 2)
+    sink.process(b'\x01\x02\x03\x04')
+
+    database = str(tmp_path / 'results.db')
+    with ResultStore(database) as store:
+        store.add({'digestive': '0.1'})
+        store.add(dict({'source': 'a', 'size': 4}, **dict(sink.results())))
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT source, md5 FROM sources').fetchall() == [
+            ('a', '08d6c05a21512a79a1dfeb9d2a8f262f')]
+        assert connection.execute('SELECT source, name, number, digest FROM windows ORDER BY number').fetchall() == [
+            (1, 'md5-windows', 0, hashlib.md5(b'\x01\x02').hexdigest()),
+            (1, 'md5-windows', 1, hashlib.md5(b'\x03\x04').hexdigest()),
+        ]
+
+
+def test_result_store_chunks(tmp_path):
+    sink = Chunks()
+    sink.process(b'\x01\x02\x03\x04')
+
+    database = str(tmp_path / 'results.db')
+    with ResultStore(database) as store:
+        store.add({'digestive': '0.1'})
+        store.add(dict({'source': 'a', 'size': 4, 'modified': 1}, **dict(sink.results())))
+
+    with sqlite3.connect(database) as connection:
+        # sha256sum files/1234
+        assert connection.execute('SELECT source, name, position, length, digest FROM chunks').fetchall() == [
+            (1, 'chunks', 0, 4, '9f64a747e1b97f131fabb6b447296c9b6f0201e79fb3c5356e6c77e89b6a806a')]
+
+    assert known_sources(database, ['chunks']) == {'a': (4, 1)}
+
+
+def test_result_store_runs(tmp_path):
+    database = str(tmp_path / 'results.db')
+    for size, modified in ((4, 1), (8, 2)):
+        with ResultStore(database, indexed=['sha1']) as store:
+            store.add({'digestive': '0.1'})
+            store.add({'source': 'a', 'size': size, 'modified': modified, 'sha1': 'abc'})
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT run, size, modified, sha1 FROM sources ORDER BY id').fetchall() == [
+            (1, 4, 1, 'abc'), (2, 8, 2, 'abc')]
+        assert 'sources_sha1' in {row[1] for row in connection.execute('PRAGMA index_list(sources)')}
+
+    # latest run takes precedence
+    assert known_sources(database) == {'a': (8, 2)}
+    assert known_sources(database, ['sha1']) == {'a': (8, 2)}
+
+
+def test_known_sources_results(tmp_path):
+    sink = HashWindows(MD5(), 2)
+    sink.process(b'\x01\x02\x03\x04')
+
+    database = str(tmp_path / 'results.db')
+    with ResultStore(database) as store:
+        store.add({'digestive': '0.1'})
+        store.add({'source': 'a', 'size': 4, 'modified': 1, 'md5': '08d6c05a21512a79a1dfeb9d2a8f262f'})
+        store.add({'source': 'b', 'size': 4, 'modified': 1, 'sha1': '12dada1fff4d4787ade3333147202c3b443e376f'})
+        store.add(dict({'source': 'c', 'size': 4, 'modified': 1}, **dict(sink.results())))
+
+    assert known_sources(database, ['md5']) == {'a': (4, 1), 'c': (4, 1)}
+    # results that weren't recorded for a source (or at all) make it unknown
+    assert known_sources(database, ['md5', 'sha1']) == {}
+    assert known_sources(database, ['sha256']) == {}
+    # window digests are recorded in a table of their own
+    assert known_sources(database, ['md5', 'md5-windows']) == {'c': (4, 1)}
+
+
+def test_result_store_error(tmp_path):
+    store = ResultStore(str(tmp_path / 'missing' / 'results.db'))
+    # the writer fails to connect right away, nothing is added to have the failure surface in close
+    store.open()
+
+    with pytest.raises(RuntimeError) as error:
+        store.close()
+    assert isinstance(error.value.__cause__, sqlite3.Error)
+
+
+def test_result_store_error_final_batch(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.db'))
+    store.open()
+    # column names are case insensitive, adding a column ID fails as it duplicates id
+    store.add({'digestive': '0.1'})
+    store.add({'source': 'a', 'ID': 1})
+
+    # the failing batch includes close's sentinel, close should return rather than waiting for the writer forever
+    with pytest.raises(RuntimeError):
+        store.close()
+
+
+def test_result_store_error_other(tmp_path):
+    digests = SpooledTemporaryFile()
+    digests.close()
+
+    store = ResultStore(str(tmp_path / 'results.db'), batch_size=1)
+    store.open()
+    store.add({'digestive': '0.1'})
+    # reading window digests from a closed file raises ValueError, rather than sqlite3.Error
+    store.add({'source': 'a', 'md5-windows': WindowDigests(digests, 16, 1)})
+
+    # the writer keeps draining the queue after failing, adding more documents than fit in the queue doesn't block
+    with pytest.raises(RuntimeError):
+        for _ in range(100):
+            store.add({'source': 'b'})
+    with pytest.raises(RuntimeError) as error:
+        store.close()
+    assert isinstance(error.value.__cause__, ValueError)
+
+
+def test_known_sources_missing(tmp_path):
+    assert known_sources(str(tmp_path / 'results.db')) == {}
+
+    # an empty file is a valid database, without any tables
+    (tmp_path / 'empty.db').touch()
+    assert known_sources(str(tmp_path / 'empty.db')) == {}
@@ -1,6 +1,7 @@
+import hashlib
 from os import path
 
-from digestive.hash import MD5, SHA1, SHA256, SHA512
+from digestive.hash import HashWindows, MD5, SHA1, SHA256, SHA512
 from digestive.io import Source
 
 
@@ -113,3 +114,58 @@ def test_random_raw():
     ]
     for (result, expected) in zip((sink.result() for sink in sinks), hashes):
         assert result == expected
+
+
+def test_copy():
+    sink = MD5()
+    sink.process(b'\x01\x02')
+    digest = sink.copy()
+    sink.process(b'\x03\x04')
+
+    # the copy is unaffected by data processed later, and vice versa
+    digest.update(b'\x05')
+    assert digest.hexdigest() == hashlib.md5(b'\x01\x02\x05').hexdigest()
+    # md5sum files/1234
+    assert sink.result() == '08d6c05a21512a79a1dfeb9d2a8f262f'
+
+
+def test_windows():
+    sink = HashWindows(MD5(), 4)
+    # feed 10 bytes in blocks not aligned to the window size
+    for block in (b'\x01\x02\x03', b'\x04\x01\x02\x03\x04\x05', b'\x06'):
+        sink.process(block)
+
+    results = dict(sink.results())
+    assert results['md5'] == hashlib.md5(bytes([1, 2, 3, 4, 1, 2, 3, 4, 5, 6])).hexdigest()
+    assert list(results['md5-windows']) == [
+        # md5sum files/1234, twice
+        '08d6c05a21512a79a1dfeb9d2a8f262f',
+        '08d6c05a21512a79a1dfeb9d2a8f262f',
+        # trailing partial window
+        hashlib.md5(b'\x05\x06').hexdigest(),
+    ]
+    assert len(results['md5-windows']) == 3
+    assert str(results['md5-windows']) == '3 windows of 4 bytes'
+    # results can be requested (and iterated) more than once
+    assert dict(sink.results()) == results
+    assert list(results['md5-windows'])[0] == '08d6c05a21512a79a1dfeb9d2a8f262f'
+
+
+def test_windows_spooled():
+    sink = HashWindows(SHA256(), 1)
+    data = bytes(range(256)) * 256
+    sink.process(data)
+
+    # 64 KiB windows of 32 bytes spill the digests to disk
+    windows = dict(sink.results())['sha256-windows']
+    assert len(windows) == len(data)
+    assert list(windows)[-1] == hashlib.sha256(b'\xff').hexdigest()
+
+
+def test_windows_empty():
+    sink = HashWindows(SHA256(), 1 << 20)
+
+    results = dict(sink.results())
+    # sha256sum files/empty
+    assert results['sha256'] == 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
+    assert list(results['sha256-windows']) == []
@@ -1,16 +1,25 @@
 from argparse import Namespace
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from os import path
+from functools import partial
+from io import BytesIO
+from os import path, utime
+import sqlite3
 
-from hamcrest import match_equality as eq, contains_string, ends_with, instance_of
+from hamcrest import match_equality as eq, contains_string, ends_with, instance_of, is_not
 import pytest
 from unittest.mock import ANY, call, MagicMock, Mock, patch
+import yaml
 
+from digestive.chunking import ChunkSummary
 from digestive.entropy import Entropy
-from digestive.hash import MD5, SHA1, SHA256, SHA512, SHA3256, SHA3512
-from digestive.io import Source
-from digestive.main import file_size, main, num_bytes, parse_arguments, process_arguments, process_source, Progress
+from digestive.hash import HashWindows, MD5, SHA1, SHA256, SHA512, SHA3256, SHA3512
+from digestive.io import BufferPool, Source, StdinSource
+from digestive.main import (chunk_sizes, create_sinks, device_jobs, file_size, main, num_bytes, parse_arguments,
+                            process_arguments, process_batch, process_inline, process_source, Progress, report_batches,
+                            shard, shard_spec, sink_type, submit_batch)
+from digestive.stats import Mean, SerialCorrelation
 
 
 here = path.dirname(path.abspath(__file__))
@@ -44,11 +53,49 @@ def test_num_bytes():
         num_bytes('123l')
 
 
+def test_shard_spec():
+    assert shard_spec('1/1') == (1, 1)
+    assert shard_spec('3/4') == (3, 4)
+
+    for spec in ('0/4', '5/4', '1', '1/', 'a/b'):
+        with pytest.raises(TypeError):
+            shard_spec(spec)
+
+
+def test_shard():
+    sources = ['source{}'.format(i) for i in range(100)]
+
+    shards = [list(shard(sources, index, 4)) for index in range(1, 5)]
+    # every source ends up in exactly one shard, retaining order within shards
+    assert sorted(source for selected in shards for source in selected) == sorted(sources)
+    assert all(selected == sorted(selected, key=sources.index) for selected in shards)
+    # partitioning is deterministic
+    assert shards == [list(shard(sources, index, 4)) for index in range(1, 5)]
+
+
+def test_shard_size():
+    sources = ['a' * size for size in (9, 1, 5, 4, 3, 2, 7, 1)]
+
+    shards = [list(shard(sources, index, 2, by='size')) for index in range(1, 3)]
+    assert sorted(source for selected in shards for source in selected) == sorted(sources)
+    # total size of 32 is divided evenly
+    assert [sum(len(source) for source in selected) for selected in shards] == [16, 16]
+
+
 def test_process_arguments():
     parser = Mock()
     args = Namespace()
     args.sinks = []
     args.jobs = None
+    args.tee = None
+    args.devices = False
+    args.device_jobs = None
+    args.max_memory = None
+    args.block_size = 1 << 20
+    args.io_mode = 'default'
+    args.incremental = False
+    args.output_db = None
+    args.hash_window = None
 
     process_arguments(args, parser)
     parser.error.assert_called_with('at least one sink is required')
@@ -63,6 +110,74 @@ def test_process_arguments():
     process_arguments(args, parser)
     assert args.jobs == 1
 
+    args.sinks = ['digestive.hash:MD5', Entropy]
+
+    process_arguments(args, parser)
+    assert args.sinks == [MD5, Entropy]
+
+    args.tee = '-'
+    args.devices = True
+    parser.reset_mock()
+
+    process_arguments(args, parser)
+    parser.error.assert_called_with(eq(contains_string('--tee')))
+
+    args.tee = None
+    args.max_memory = 1 << 20
+    parser.reset_mock()
+
+    process_arguments(args, parser)
+    parser.error.assert_called_with(eq(contains_string('--max-memory')))
+
+    # direct I/O rounds buffers up to whole pages
+    args.block_size = 1000
+    args.max_memory = 2000
+    parser.reset_mock()
+
+    process_arguments(args, parser)
+    parser.error.assert_not_called()
+
+    args.io_mode = 'direct'
+
+    process_arguments(args, parser)
+    parser.error.assert_called_with(eq(contains_string('whole pages')))
+
+    args.max_memory = None
+    args.hash_window = 0
+    parser.reset_mock()
+
+    process_arguments(args, parser)
+    parser.error.assert_called_with(eq(contains_string('--hash-window')))
+
+    args.hash_window = None
+    args.incremental = True
+    parser.reset_mock()
+
+    process_arguments(args, parser)
+    parser.error.assert_called_with(eq(contains_string('--output-db')))
+
+
+def test_chunk_sizes():
+    assert chunk_sizes('2k:8k:64k') == (2 << 10, 8 << 10, 64 << 10)
+    assert chunk_sizes('1:1:1') == (1, 1, 1)
+
+    for sizes in ('2k:8k', '8k:2k:64k', '0:1:2', '1:2:3:4'):
+        with pytest.raises(TypeError):
+            chunk_sizes(sizes)
+
+
+def test_device_jobs():
+    assert device_jobs('{}=3'.format(here)) == (Source(here).device, 3)
+
+    for spec in ('{}'.format(here), '{}=0'.format(here), '=2', path.join(here, 'nonexistent=2')):
+        with pytest.raises(TypeError):
+            device_jobs(spec)
+
+
+def test_sink_type():
+    assert sink_type('digestive.hash:SHA256') is SHA256
+    assert sink_type('digestive.stats:Mean') is Mean
+
 
 def test_parse_arguments():
     arguments = ['-m125', 'source1', 'source2']
@@ -101,6 +216,37 @@ def test_parse_arguments():
     arguments = parse_arguments(arguments)
 
     assert SHA3512 in arguments.sinks
+    assert arguments.shard is None
+
+    arguments = ['-m', '--shard', '2/3', '--shard-by', 'size', 'source']
+    arguments = parse_arguments(arguments)
+
+    assert arguments.shard == (2, 3)
+    assert arguments.shard_by == 'size'
+
+    arguments = ['--statistics', 'source']
+    arguments = parse_arguments(arguments)
+
+    assert Entropy in arguments.sinks
+    assert SerialCorrelation in arguments.sinks
+
+    arguments = ['--chunk-summary', '--chunk-sizes', '1k:4k:16k', 'source']
+    arguments = parse_arguments(arguments)
+
+    assert ChunkSummary in arguments.sinks
+    assert arguments.chunk_sizes == (1 << 10, 4 << 10, 16 << 10)
+
+    assert not arguments.devices
+
+    arguments = ['-m', '--device-jobs', '{}=2'.format(here), 'source']
+    arguments = parse_arguments(arguments)
+
+    assert arguments.device_jobs == [(Source(here).device, 2)]
+
+    arguments = ['-2', '--hash-window', '64M', 'source']
+    arguments = parse_arguments(arguments)
+
+    assert arguments.hash_window == 64 << 20
 
 
 def test_process_source():
@@ -137,6 +283,74 @@ def test_process_source_progress():
         progress.set.assert_has_calls([call(3), call(4)])
 
 
+def test_process_inline():
+    source = Source(path.join(here, 'files/1234'))
+    sink = Mock()
+    with source:
+        assert process_inline(source, [sink]) == 4
+
+    sink.process.assert_called_once_with(b'\x01\x02\x03\x04')
+
+    source = Source(path.join(here, 'files/empty'))
+    sink = Mock()
+    with source:
+        assert process_inline(source, [sink]) == 0
+
+    assert not sink.process.called
+
+
+def test_process_batch():
+    sources = [Source(path.join(here, 'files/1234')), Source(path.join(here, 'files/empty'))]
+
+    processed = process_batch(sources, partial(create_sinks, [MD5]))
+
+    assert [(source, size, results) for source, size, results, _ in processed] == [
+        (sources[0], 4, {'md5': '08d6c05a21512a79a1dfeb9d2a8f262f'}),
+        (sources[1], 0, {'md5': 'd41d8cd98f00b204e9800998ecf8427e'}),
+    ]
+    assert all(isinstance(completed, datetime) for *_, completed in processed)
+    assert all(source.fd is None for source in sources)
+
+
+def test_process_source_pool():
+    with ThreadPoolExecutor(2) as executor:
+        pool = BufferPool(4)
+        source = Source(path.join(here, 'files/1234'))
+        sink = Mock()
+
+        with source:
+            process_source(executor, source, [sink], block_size=2, pool=pool)
+        with source:
+            process_source(executor, source, [sink], block_size=2, pool=pool)
+
+        assert sink.process.call_count == 4
+        # buffers are returned to and reused from the pool
+        assert pool.stats() == {'hits': 2, 'misses': 2, 'waits': 0, 'allocated': 4, 'peak': 4}
+
+
+def test_process_batch_pool():
+    pool = BufferPool()
+    sources = [Source(path.join(here, 'files/1234')), Source(path.join(here, 'files/empty'))]
+
+    processed = process_batch(sources, partial(create_sinks, [MD5]), pool=pool, block_size=2)
+
+    # 1234 is larger than the buffer, it's read in multiple parts
+    assert [(size, results) for _, size, results, _ in processed] == [
+        (4, {'md5': '08d6c05a21512a79a1dfeb9d2a8f262f'}),
+        (0, {'md5': 'd41d8cd98f00b204e9800998ecf8427e'}),
+    ]
+    # a single buffer is used for the entire batch
+    assert pool.misses == 1
+
+
+def test_progress_unknown_size():
+    with patch('digestive.main.print') as print:
+        with Progress(StdinSource(), 'bytes') as progress:
+            progress.set(1024)
+            print.assert_called_with(eq(contains_string('1.000 KiB')), end='')
+            print.assert_called_with(eq(is_not(contains_string('%'))), end='')
+
+
 def test_progress():
     with patch('digestive.main.print') as print:
         with Progress('string has length 20') as progress:
@@ -153,6 +367,181 @@ def test_progress():
         print.assert_called_with('\033[2K\r', end='')
 
 
+def test_create_sinks():
+    sinks = create_sinks([MD5, Entropy])
+    assert isinstance(sinks[0], MD5)
+    assert isinstance(sinks[1], Entropy)
+
+    sinks = create_sinks([Entropy, Mean, SHA1])
+    assert sinks[0].statistics is sinks[1].statistics
+    # shared statistics are processed as a separate sink
+    assert sinks[0].statistics in sinks
+    assert len(sinks) == 4
+
+    sinks = create_sinks([MD5, Entropy], hash_window=1 << 20)
+    assert isinstance(sinks[0], HashWindows)
+    assert isinstance(sinks[0].sink, MD5)
+    assert isinstance(sinks[1], Entropy)
+
+
+def test_submit_batch():
+    container, other = object(), object()
+    executor = Mock()
+    executor.submit.return_value.result.return_value = []
+    pending = deque()
+
+    first = [Mock(container=container)]
+    previous = submit_batch(executor, len, first, None, Mock(), pending)
+    assert previous is first
+    previous = submit_batch(executor, len, [Mock(container=other)], previous, Mock(), pending)
+    # members of different archives can be processed concurrently
+    assert len(pending) == 2
+
+    submit_batch(executor, len, [Mock(container=other)], previous, Mock(), pending)
+    # members of the same archive wait for the previous batch to complete
+    assert len(pending) == 1
+
+
+def test_report_batches():
+    source = Mock(streaming=False, __str__=Mock(return_value='source'))
+    pending = deque(Future() for _ in range(5))
+    for future in list(pending)[:4]:
+        future.set_result([(source, 4, {'md5': 'digest'}, None)])
+    output = Mock()
+
+    with patch('builtins.print'):
+        # stop at the first batch that's not done
+        report_batches(output, pending, wait=False, keep=3)
+        assert len(pending) == 3
+        report_batches(output, pending, wait=False)
+        assert len(pending) == 1
+        # batches beyond keep are waited for
+        report_batches(output, pending, keep=1)
+        assert len(pending) == 1
+
+    assert output.send.call_count == 4
+
+
+def test_main_hash_window(tmp_path):
+    with patch('builtins.print') as mocked_print:
+        main(['-m', '--hash-window', '2', '--output', str(tmp_path / 'output.yml'), path.join(here, 'files/1234')])
+
+    # windows are summarized on the console…
+    mocked_print.assert_any_call('  md5-windows  2 windows of 2 bytes')
+    # …and listed in the output
+    with open(tmp_path / 'output.yml') as stream:
+        _, document = yaml.safe_load_all(stream)
+    assert document['md5-windows'] == ['0cb988d042a7f28dd5fe2b55b3f5ac7a', 'c58cea7ef6e89ca39f9401edb12d241d']
+
+
+def test_main_chunks(tmp_path):
+    with patch('builtins.print') as mocked_print:
+        main(['--chunks', '--output', str(tmp_path / 'output.yml'), path.join(here, 'files/1234')])
+
+    # chunks are summarized on the console…
+    mocked_print.assert_any_call('  chunks       1 chunks')
+    # …and listed in the output
+    with open(tmp_path / 'output.yml') as stream:
+        _, document, _ = yaml.safe_load_all(stream)
+    assert document['chunks'] == ['0+4 9f64a747e1b97f131fabb6b447296c9b6f0201e79fb3c5356e6c77e89b6a806a']
+
+
+def test_main_order():
+    with patch('builtins.print') as mocked_print, patch('digestive.main.output_to_file') as output:
+        output_generator = MagicMock()
+        output.return_value = output_generator
+        # 1234 is larger than a single 2-byte block, empty is processed as a small source
+        sources = [path.join(here, 'files/empty'), path.join(here, 'files/1234'), path.join(here, 'files/empty')]
+        main(['-m', '--block-size', '2', *sources])
+
+        headers = [call.args[0] for call in mocked_print.call_args_list if call.kwargs.get('flush')]
+        assert headers == ['{} ({})'.format(source, file_size(size)) for source, size in zip(sources, (0, 4, 0))]
+        assert [call.args[0]['source'] for call in output_generator.send.call_args_list[1:]] == sources
+
+
+def test_main_devices():
+    with patch('builtins.print'), patch('digestive.main.output_to_file') as output:
+        output_generator = MagicMock()
+        output.return_value = output_generator
+        main(['-m', '--devices', '--block-size', '2', path.join(here, 'files/1234'), path.join(here, 'files/empty')])
+
+        output_generator.send.assert_has_calls([
+            call({'source': path.join(here, 'files/1234'), 'size': 4, 'modified': ANY, 'completed': ANY,
+                  'md5': '08d6c05a21512a79a1dfeb9d2a8f262f'}),
+            call({'source': path.join(here, 'files/empty'), 'size': 0, 'modified': ANY, 'completed': ANY,
+                  'md5': 'd41d8cd98f00b204e9800998ecf8427e'}),
+        ], any_order=True)
+
+
+def test_main_device_jobs():
+    wrapped = patch('concurrent.futures.ThreadPoolExecutor', wraps=ThreadPoolExecutor)
+    with patch('builtins.print'), patch('digestive.main.output_to_file'), wrapped as executor:
+        # two readers on the device containing the test files, each feeding 2 sinks
+        main(['-m', '-1', '--device-jobs', '{}=2'.format(here), '--block-size', '2',
+              path.join(here, 'files/1234'), path.join(here, 'files/empty')])
+
+    # the scheduler runs its readers on an executor of its own (patched too if digestive.schedule wasn't imported yet)
+    executor.assert_any_call(4)
+
+
+def test_main_stdin_tee(tmp_path):
+    stdin = Mock(buffer=BytesIO(b'\x01\x02\x03\x04'))
+    to_file = patch('digestive.main.output_to_file')
+    with patch('builtins.print') as mocked_print, patch('sys.stdin', stdin), to_file as output:
+        output_generator = MagicMock()
+        output.return_value = output_generator
+        main(['-m', '--tee', str(tmp_path / 'copy'), '-', path.join(here, 'files/empty')])
+
+        mocked_print.assert_any_call('<stdin> (unknown size)', flush=True)
+        output_generator.send.assert_any_call({'source': '<stdin>', 'size': 4, 'modified': None, 'completed': ANY,
+                                               'md5': '08d6c05a21512a79a1dfeb9d2a8f262f'})
+
+    # data from all sources is copied
+    assert (tmp_path / 'copy').read_bytes() == b'\x01\x02\x03\x04'
+
+
+def test_main_output_db(tmp_path):
+    database = str(tmp_path / 'results.db')
+    changed = tmp_path / 'changed'
+    changed.write_bytes(b'\x01\x02')
+    sources = [path.join(here, 'files/1234'), str(changed)]
+    with patch('builtins.print'):
+        main(['-m', '--output-db', database, *sources])
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT count(*) FROM runs').fetchone() == (1,)
+        assert connection.execute('SELECT source, size FROM sources WHERE md5 = ?',
+                                  ('08d6c05a21512a79a1dfeb9d2a8f262f',)).fetchall() == [(sources[0], 4)]
+
+    changed.write_bytes(b'\x01\x02\x03')
+    with patch('builtins.print') as mocked_print:
+        # second run should skip the unchanged source
+        main(['-m', '--output-db', database, '--incremental', *sources])
+        headers = [call.args[0] for call in mocked_print.call_args_list if call.kwargs.get('flush')]
+        assert headers == ['{} (3 bytes)'.format(changed)]
+
+    # same size, but modified since the previous run
+    modified = changed.stat().st_mtime_ns + 1_000_000_000
+    utime(changed, ns=(modified, modified))
+    with patch('builtins.print') as mocked_print:
+        main(['-m', '--output-db', database, '--incremental', *sources])
+        headers = [call.args[0] for call in mocked_print.call_args_list if call.kwargs.get('flush')]
+        assert headers == ['{} (3 bytes)'.format(changed)]
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT modified FROM sources WHERE source = ? ORDER BY id DESC',
+                                  (str(changed),)).fetchone() == (modified,)
+
+    with patch('builtins.print') as mocked_print:
+        # unchanged sources are processed again when results are requested that weren't recorded for them
+        main(['-2', '--output-db', database, '--incremental', *sources])
+        headers = [call.args[0] for call in mocked_print.call_args_list if call.kwargs.get('flush')]
+        assert headers == ['{} (4 bytes)'.format(sources[0]), '{} (3 bytes)'.format(changed)]
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT count(*) FROM sources WHERE sha256 IS NOT NULL').fetchone() == (2,)
+
+
 def test_main():
     with patch('builtins.print') as mocked_print:
         arguments = ['--hashes', '--output', '/dev/null', path.join(here, 'files/empty'), path.join(here, 'files/1234')]
@@ -166,6 +555,7 @@ def test_main():
     four_bytes_output = {
         'source': eq(ends_with('files/1234')),
         'size': 4,
+        'modified': eq(instance_of(int)),
         'completed': ANY,
         'md5': '08d6c05a21512a79a1dfeb9d2a8f262f',
         'sha1': '12dada1fff4d4787ade3333147202c3b443e376f',
@@ -176,6 +566,7 @@ def test_main():
     random_dd_output = {
         'source': eq(ends_with('files/random.dd')),
         'size': 1048576,
+        'modified': eq(instance_of(int)),
         'completed': eq(instance_of(datetime)),
         'md5': '257f5c2913ea856cb0a2313f167452d4',
         'sha1': '2f8a9e749cc8e46bebe602827228e76611346f54',
@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+
+import yaml
+
+from digestive.merge import main, merge
+
+
+def _output(shard, started, *sources):
+    info = {'digestive': '0.1', 'started': started, 'shard': shard}
+    return yaml.safe_dump_all([info, *({'source': source, 'size': 4} for source in sources)],
+                              explicit_start=True, sort_keys=False)
+
+
+def test_merge():
+    first = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    second = datetime(2020, 1, 2, tzinfo=timezone.utc)
+
+    documents = list(merge([_output('2/2', second, 'c', 'a'), _output('1/2', first, 'd', 'b')]))
+
+    assert documents[0]['started'] == first
+    assert documents[0]['shards'] == ['2/2', '1/2']
+    assert [document['source'] for document in documents[1:]] == ['a', 'b', 'c', 'd']
+
+
+def test_main(tmp_path):
+    started = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    (tmp_path / 'shard1.yml').write_text(_output('1/2', started, 'b'))
+    (tmp_path / 'shard2.yml').write_text(_output('2/2', started, 'a'))
+
+    main(['--output', str(tmp_path / 'merged.yml'), str(tmp_path / 'shard1.yml'), str(tmp_path / 'shard2.yml')])
+
+    documents = list(yaml.safe_load_all((tmp_path / 'merged.yml').read_text()))
+    assert len(documents) == 3
+    assert [document['source'] for document in documents[1:]] == ['a', 'b']
@@ -0,0 +1,112 @@
+from os import path
+import threading
+from threading import Lock
+import time
+
+import pytest
+
+from digestive.io import Source
+from digestive.schedule import device_of, DeviceScheduler, rotational
+
+
+here = path.dirname(path.abspath(__file__))
+
+
+class FakeSource:
+    def __init__(self, name, device):
+        self.name = name
+        self.device = device
+
+
+class FakeContainer:
+    def __init__(self, source):
+        self.source = source
+
+
+class FakeMember(FakeSource):
+    def __init__(self, name, container):
+        super().__init__(name, container.source.device)
+        self.container = container
+
+
+class Tracker:
+    def __init__(self):
+        self.lock = Lock()
+        self.active = {}
+        self.peak = {}
+        self.threads = {}
+
+    def __call__(self, source):
+        with self.lock:
+            self.active[source.device] = self.active.get(source.device, 0) + 1
+            self.peak[source.device] = max(self.peak.get(source.device, 0), self.active[source.device])
+        time.sleep(0.01)
+        with self.lock:
+            self.active[source.device] -= 1
+            self.threads[source.name] = threading.get_ident()
+        return source.name.upper()
+
+
+def test_device():
+    source = Source(path.join(here, 'files/1234'))
+
+    assert source.device == device_of(path.join(here, 'files'))
+    assert rotational(None) is None
+
+
+def test_limit():
+    scheduler = DeviceScheduler({1: 3}, hdd_jobs=1, ssd_jobs=4)
+
+    assert scheduler.limit(1) == 3
+    # device ID 0 is not a block device, unknown devices are treated as rotational
+    assert scheduler.limit(0) == 1
+
+
+def test_run():
+    sources = [FakeSource('a{}'.format(i), 1) for i in range(6)] + [FakeSource('b{}'.format(i), 2) for i in range(6)]
+    scheduler = DeviceScheduler({1: 1, 2: 3})
+    tracker = Tracker()
+
+    queues = scheduler.queue(sources)
+    assert scheduler.readers(queues) == 4
+
+    results = list(scheduler.run(queues, tracker))
+
+    assert sorted(results, key=lambda item: item[0].name) == [(source, source.name.upper()) for source in sources]
+    assert tracker.peak == {1: 1, 2: 3}
+
+
+def test_run_archive():
+    archive = FakeContainer(FakeSource('archive', 1))
+    nested = FakeContainer(FakeMember('nested', archive))
+    members = [FakeMember('m{}'.format(i), archive) for i in range(4)] + [FakeMember('n0', nested)]
+    sources = members + [FakeSource('a', 1), FakeSource('b', 1)]
+    scheduler = DeviceScheduler({1: 3})
+    tracker = Tracker()
+
+    # members of the archive (including those of archives nested within it) make up a single unit
+    queues = scheduler.queue(sources)
+    assert list(queues[1]) == [members, [sources[-2]], [sources[-1]]]
+    assert scheduler.readers(queues) == 3
+
+    results = list(scheduler.run(queues, tracker))
+
+    assert len(results) == len(sources)
+    # members are read in order by a single reader
+    assert [source.name for source, _ in results if source in members] == [member.name for member in members]
+    assert len({tracker.threads[member.name] for member in members}) == 1
+
+
+def test_run_error():
+    def process(source):
+        raise ValueError(source.name)
+
+    scheduler = DeviceScheduler({1: 2})
+
+    with pytest.raises(ValueError):
+        list(scheduler.run(scheduler.queue([FakeSource('a', 1), FakeSource('b', 1)]), process))
+
+
+def test_run_empty():
+    assert list(DeviceScheduler().run({}, print)) == []
+    assert DeviceScheduler().readers({}) == 0
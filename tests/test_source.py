@@ -1,7 +1,13 @@
+import io
+import mmap
+import os
 from os import path
+from threading import Timer
+from unittest.mock import Mock, patch
+
 import pytest
 
-from digestive.io import Source
+from digestive.io import BufferPool, io_modes, Source, StdinSource, Tee
 
 
 here = path.dirname(path.abspath(__file__))
@@ -50,3 +56,109 @@ def test_blocks():
         with pytest.raises(StopIteration):
             next(generator)
             raise AssertionError('StopIteration should have been raised')
+
+
+@pytest.mark.skipif(not hasattr(os, 'posix_fadvise'), reason='posix_fadvise is not available')
+@pytest.mark.parametrize('io_mode', io_modes)
+def test_io_modes(io_mode, tmp_path):
+    data = bytes(range(256)) * 64
+    (tmp_path / 'data').write_bytes(data)
+    source = Source(str(tmp_path / 'data'), io_mode=io_mode)
+
+    with patch('os.posix_fadvise') as fadvise, source:
+        fd = source.fd.fileno()
+        assert b''.join(source.blocks(4096)) == data
+        assert source.offset == len(data)
+
+    advice = [call.args for call in fadvise.call_args_list]
+    if io_mode == 'default' or source._direct:
+        # no hints by default, O_DIRECT bypasses the page cache altogether
+        assert advice == []
+        return
+
+    # read ahead from the start…
+    assert advice[0] == (fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    # …requesting the next block after every block read…
+    assert [args for args in advice if args[3] == os.POSIX_FADV_WILLNEED] == [
+        (fd, offset, 4096, os.POSIX_FADV_WILLNEED) for offset in range(4096, len(data) + 1, 4096)]
+    # …dropping blocks that have been read from the page cache, unless just reading sequentially
+    assert [args for args in advice if args[3] == os.POSIX_FADV_DONTNEED] == ([] if io_mode == 'sequential' else [
+        (fd, offset, 4096, os.POSIX_FADV_DONTNEED) for offset in range(0, len(data), 4096)])
+
+
+def test_allocate_direct():
+    source = Source(path.join(here, 'files/1234'), io_mode='direct')
+
+    with source:
+        buffer = source.allocate(1000)
+        # O_DIRECT needs buffers of whole pages (where supported)
+        assert len(buffer) >= 1000
+        assert not source._direct or len(buffer) % mmap.PAGESIZE == 0
+        assert source.readinto(buffer) == 4
+
+
+def test_stdin():
+    with open(path.join(here, 'files/1234'), 'rb') as stdin, patch('sys.stdin', Mock(buffer=stdin)):
+        source = StdinSource()
+
+        assert str(source) == '<stdin>'
+        assert len(source) == 0
+        assert source.streaming
+        assert source.device is None
+
+        with source:
+            assert b''.join(source.blocks(3)) == b'\x01\x02\x03\x04'
+
+        assert source.fd is None
+        # stdin itself should be left open
+        assert not stdin.closed
+
+    assert len(StdinSource(expected_size=4)) == 4
+
+
+def test_tee():
+    stream = io.BytesIO()
+    sink = Tee(stream)
+    sink.process(b'\x01\x02')
+    sink.process(memoryview(b'\x03\x04'))
+
+    assert stream.getvalue() == b'\x01\x02\x03\x04'
+    assert list(sink.results()) == []
+
+
+def test_pool():
+    pool = BufferPool(max_memory=8)
+
+    first, second = pool.acquire(4, count=2)
+    assert len(first) == len(second) == 4
+    assert pool.misses == 2
+
+    with pytest.raises(ValueError):
+        pool.acquire(4, count=3)
+
+    # waits until buffers are released by another thread
+    releaser = Timer(0.05, pool.release, (first,))
+    releaser.start()
+    (third,) = pool.acquire(4)
+    releaser.join()
+
+    assert third is first
+    assert pool.stats() == {'hits': 1, 'misses': 2, 'waits': 1, 'allocated': 8, 'peak': 8}
+
+    # free buffers of other sizes are evicted to make room
+    pool.release(second, third)
+    (large,) = pool.acquire(8)
+    assert len(large) == 8
+    assert pool.allocated == 8
+
+
+def test_blocks_pool():
+    pool = BufferPool()
+    source = Source(path.join(here, 'files/1234'))
+
+    with source:
+        assert b''.join(source.blocks(3, pool=pool)) == b'\x01\x02\x03\x04'
+
+    # both buffers have been returned to the pool
+    assert len(pool.acquire(3, count=2)) == 2
+    assert pool.hits == 2
@@ -0,0 +1,72 @@
+from math import pi
+
+from digestive.entropy import Entropy
+from digestive.stats import ByteStatistics, ChiSquare, Mean, MonteCarloPi, SerialCorrelation
+
+
+def test_empty():
+    sinks = [ChiSquare(), Mean(), MonteCarloPi(), SerialCorrelation()]
+    for sink in sinks:
+        sink.process(b'')
+
+    # statistics are meaningless without data
+    assert all(sink.result() is None for sink in sinks)
+
+
+def test_range():
+    sinks = [ChiSquare(), Mean(), SerialCorrelation()]
+    for sink in sinks:
+        sink.process(bytes(range(256)))
+
+    assert float(sinks[0].result()) == 0.0
+    assert float(sinks[1].result()) == 127.5
+    # correlation is strong for incrementing values, but not perfect due to wrapping around to the start
+    assert 0.9 < float(sinks[2].result()) < 1.0
+
+
+def test_serial_correlation():
+    sink = SerialCorrelation()
+    sink.process(b'\x01\x02')
+    sink.process(b'\x03\x04')
+
+    # ent reports -0.2 for the bytes 1, 2, 3, 4 (as correlation wraps around from the last to the first byte)
+    assert float(sink.result()) == -0.2
+
+    sink = SerialCorrelation()
+    sink.process(b'\x00' * 16)
+
+    assert sink.result() == 'undefined'
+
+
+def test_monte_carlo_pi():
+    sink = MonteCarloPi()
+    # feed points not aligned to block boundaries: (0, 0) is inside, (max, max) is not
+    sink.process(b'\x00\x00\x00\x00')
+    sink.process(b'\x00\x00\xff\xff\xff\xff')
+    sink.process(b'\xff\xff')
+
+    assert sink.statistics.points == 2
+    assert float(sink.result()) == 2.0
+
+    sink = MonteCarloPi()
+    # a regular grid of points approximates pi reasonably well
+    sink.process(b''.join(bytes((x, 0, 0, y, 0, 0)) for x in range(256) for y in range(256)))
+
+    assert abs(float(sink.result()) - pi) < 0.05
+
+
+def test_shared():
+    statistics = ByteStatistics()
+    sinks = [Entropy(statistics=statistics), Mean(statistics=statistics), SerialCorrelation(statistics=statistics)]
+
+    # shared statistics are processed once, not through the sinks sharing them
+    for sink in sinks:
+        sink.process(b'\xff' * 16)
+    statistics.process(bytes(range(256)))
+
+    assert statistics.length == 256
+    assert 'serial' in statistics.features
+    assert float(sinks[0].result()) == 8.0
+    assert float(sinks[1].result()) == 127.5
+    # the engine itself produces no results
+    assert list(statistics.results()) == []